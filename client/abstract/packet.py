@@ -4,6 +4,7 @@ from typing import Any
 from jsonobject import JsonObject
 
 from client.abstract.meta import JsonABCMeta
+from client.network.outgoing import Priority
 from client.network.websocket import Connection, Client
 from client.ui.window import MainWindow
 
@@ -34,10 +35,16 @@ class IncomingPacket(Packet, metaclass=JsonABCMeta):
     #     if len(kwargs) > 0:
     #         raise NameError(f'未知名称: {", ".join(kwargs.keys())}')
 
+    @property
+    def key(self) -> str:
+        # 相同 key 的数据包按到达顺序执行, 默认同类数据包之间保持顺序
+        return type(self).__name__
+
     @abstractmethod
     async def execute(self, connection: Connection, client: Client, window: MainWindow):
         raise NotImplementedError
 
 
 class OutgoingPacket(Packet):
-    pass
+    # 决定在发送队列中的优先级, 默认视为用户操作
+    priority: Priority = Priority.INTERACTIVE
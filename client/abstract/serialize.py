@@ -1,5 +1,6 @@
 import json
 import logging
+import zlib
 from json import JSONEncoder
 from typing import TypeVar, Any
 
@@ -7,13 +8,24 @@ from jsonobject import JsonObject
 
 from client.abstract.packet import Packet, IncomingPacket, OutgoingPacket
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 logger = logging.getLogger(__name__)
 registered: dict[str, type] = {}
+# 二进制编码中以数字代替完整的类型名称, 数值为名称 UTF-8 编码的 CRC32, 服务端按相同方式计算
+identifiers: dict[int, str] = {}
 T = TypeVar('T')
 
 field = '__serial_name__'
 
 
+def identify(name: str) -> int:
+    return zlib.crc32(name.encode('utf-8'))
+
+
 def serializable(clazz: type[T]) -> type[T]:
     defined = hasattr(clazz, field)
     if defined:
@@ -34,9 +46,13 @@ def serializable(clazz: type[T]) -> type[T]:
                 raise ValueError(f'无法生成包 {clazz} 的完整名称')
     if name is None:
         raise ValueError('序列化类型名称不可为 None')
+    identifier = identify(name)
+    if identifiers.get(identifier, name) != name:
+        raise ValueError(f'类型 {name} 与 {identifiers[identifier]} 的编号 {identifier} 冲突')
     if not defined:
         setattr(clazz, field, name)
     registered[name] = clazz
+    identifiers[identifier] = name
     logger.info('注册可序列化对象: ' + name)
     return clazz
 
@@ -58,6 +74,8 @@ def serialize(packet: Packet) -> str:
 
 def deserialize_from_dict(values: dict[str, Any]) -> Any:
     name = values.pop('==', None)
+    if isinstance(name, int):
+        name = identifiers.get(name, None)
     if name is None or name not in registered:
         return values
     target = registered[name]
@@ -74,3 +92,45 @@ def deserialize(content: str, clazz: type[T] | None = None) -> T | Any | None:
         return clazz(json.loads(content))
     else:
         return None
+
+
+class Codec:
+    # binary 为 True 时以二进制帧发送
+    name: str = 'json'
+    binary: bool = False
+
+    def encode(self, packet: Packet) -> str | bytes:
+        return serialize(packet)
+
+    def decode(self, payload: str | bytes) -> Any:
+        return deserialize(payload)
+
+
+class MessagePackCodec(Codec):
+    name = 'msgpack'
+    binary = True
+
+    def encode(self, packet: Packet) -> bytes:
+        values = packet.to_json()
+        values['=='] = identify(getattr(packet, field))
+        return msgpack.packb(values)
+
+    def decode(self, payload: bytes) -> Any:
+        return msgpack.unpackb(payload, object_hook=deserialize_from_dict, strict_map_key=False)
+
+
+# 按偏好顺序排列, msgpack 为可选依赖
+codecs: dict[str, Codec] = {}
+if msgpack is not None:
+    codecs[MessagePackCodec.name] = MessagePackCodec()
+codecs[Codec.name] = Codec()
+
+
+def negotiate(name: str | None) -> Codec:
+    # 服务端未选择或选择了本地不支持的编码时使用 JSON
+    codec = codecs.get((name or '').strip().lower(), None)
+    if codec is None:
+        if name:
+            logger.warning(f'服务端选择了不支持的编码 {name}, 使用 json')
+        return codecs['json']
+    return codec
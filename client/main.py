@@ -1,5 +1,6 @@
 import logging.config
 import os
+import signal
 import sys
 from concurrent.futures import TimeoutError
 
@@ -24,6 +25,13 @@ def main():
         logger.info('已加载日志配置文件')
 
     sys.excepthook = handle_exception
+    if hasattr(signal, 'SIGUSR1'):
+        # kill -USR1 <pid> 导出各设备的轮询指标
+        from threading import Thread
+        from client.network.metrics import Metrics
+        metrics = Metrics()
+        # 信号可能打断正持有指标锁的主线程, 处理函数中只启动导出线程, 由其等待锁释放
+        signal.signal(signal.SIGUSR1, lambda *_: Thread(target=metrics.dump, name='MetricsDump', daemon=True).start())
     # threading.excepthook = handle_exception
 
     # 加载所有 Websocket 数据包
@@ -51,6 +59,12 @@ def main():
     except TimeoutError:
         pass
 
+    from client.network.storage import Storage
+    Storage().stop(1)
+
+    from client.network.outbox import Outbox
+    Outbox().stop(1)
+
     from client.network.backend import Backend
     from client.network.websocket import Client
     Backend().stop()
@@ -0,0 +1,122 @@
+import argparse
+import asyncio
+import logging
+import shutil
+import statistics
+import tempfile
+import time
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import Connection
+from typing import Dict, List
+
+from client.network.monitor import CycleSummary, MonitorThread
+from client.network.profile import Profiles
+from client.network.serializable import Sensor, SensorField, SensorStructure
+from client.network.simulator import Faults, Farm
+from client.network.storage import Storage
+
+logger = logging.getLogger(__name__)
+
+
+def serve(model: str, count: int, per_bus: int, faults: Faults, gateway: bool, pipe: Connection):
+    profile = Profiles().get(model)
+    loop = asyncio.new_event_loop()
+    farm = Farm()
+    pipe.send(farm.populate(profile, count, per_bus, faults, gateway))
+    farm.start(loop)
+
+    async def wait():
+        while not pipe.poll():
+            await asyncio.sleep(0.1)
+
+    loop.run_until_complete(wait())
+    farm.close(loop)
+
+
+def percentile(values: List[float], ratio: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='使用虚拟设备对监控流程进行压力测试')
+    parser.add_argument('--model', default='TNET_100')
+    parser.add_argument('--devices', type=int, default=64)
+    parser.add_argument('--per-bus', type=int, default=16)
+    parser.add_argument('--interval', type=float, default=2.0)
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--deadline', type=float, default=5.0)
+    parser.add_argument('--latency', type=float, default=0.005)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--corrupt', type=float, default=0.0)
+    parser.add_argument('--dropout', type=float, default=0.0)
+    parser.add_argument('--gateway', action='store_true', help='通过虚拟 Modbus TCP 网关而非虚拟串口连接设备')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format='[{asctime}][{levelname:8}][{name}] {message}', style='{')
+
+    profiles = Profiles()
+    profile = profiles.get(args.model)
+    if profile is None:
+        raise SystemExit(f'未找到设备配置: {args.model}')
+    # 虚拟设备的数据写入临时目录, 不污染本机的历史数据
+    directory = tempfile.mkdtemp(prefix='smartpond-benchmark-')
+    Storage(directory=directory)
+    faults = Faults(args.latency, args.jitter, args.corrupt, args.dropout)
+    receiver, sender = Pipe()
+    farm = Process(target=serve, args=(args.model, args.devices, args.per_bus, faults, args.gateway, sender),
+                   daemon=True)
+    farm.start()
+    ports = receiver.recv()
+
+    keys = [f'field_{x}' for x in range(sum(x.length for x in profile.blocks))]
+    structure = SensorStructure(type=args.model,
+                                fields={x: SensorField(key=x, name=x, unit='') for x in keys})
+    summaries: List[CycleSummary] = []
+    thread = MonitorThread(None, args.concurrency, args.deadline, reporting=False)
+    thread.listener = summaries.append
+    thread.start()
+    futures = []
+    for index, (port, slave) in enumerate(ports):
+        name = f'sim-{index}'
+        profiles.sensors[name] = {'interval': args.interval, 'jitter': args.interval / 10}
+        sensor = Sensor(id=name, name=name, port=f'{port}#{slave}', type=args.model, fields={})
+        futures.append(thread.monitor(sensor, structure))
+    for future in futures:
+        future.result()
+
+    started, cpu = time.time(), time.process_time()
+    time.sleep(args.duration)
+    elapsed, cpu = time.time() - started, time.process_time() - cpu
+    thread.end()
+    # Pipe 为双向管道, 子进程轮询的是 sender 一端, 需要从 receiver 一端发送
+    receiver.send(None)
+    farm.join(5)
+    Storage().stop(5)
+    shutil.rmtree(directory, ignore_errors=True)
+
+    latencies: Dict[str, List[float]] = {}
+    finished, timeout, failed, offline = 0, 0, 0, 0
+    for summary in summaries:
+        finished += len(summary.finished)
+        timeout += len(summary.timeout)
+        failed += len(summary.failed)
+        offline += len(summary.offline)
+        for key, latency in summary.latency.items():
+            latencies.setdefault(key, []).append(latency)
+    samples = [x for values in latencies.values() for x in values]
+    print(f'设备数量: {len(ports)}, 总线数量: {len(set(x[0] for x in ports))}, 持续时间: {elapsed:.1f}s')
+    print(f'轮次: {len(summaries)} ({len(summaries) / elapsed:.2f}/s), '
+          f'成功: {finished} ({finished / elapsed:.2f}/s), 超时: {timeout}, 失败: {failed}, 离线: {offline}')
+    if len(samples) > 0:
+        print(f'延迟(ms): 平均 {statistics.mean(samples) * 1000:.1f}, p50 {percentile(samples, 0.5) * 1000:.1f}, '
+              f'p95 {percentile(samples, 0.95) * 1000:.1f}, p99 {percentile(samples, 0.99) * 1000:.1f}, '
+              f'最大 {max(samples) * 1000:.1f}')
+        slowest = sorted(latencies.items(), key=lambda x: percentile(x[1], 0.95), reverse=True)[:5]
+        for key, values in slowest:
+            print(f'  {key}: p95 {percentile(values, 0.95) * 1000:.1f}ms, 次数 {len(values)}')
+    print(f'CPU: {cpu:.2f}s ({cpu / elapsed * 100:.1f}%)')
+
+
+if __name__ == '__main__':
+    main()
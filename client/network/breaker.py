@@ -0,0 +1,60 @@
+import logging
+import time
+from enum import Enum
+
+from client.util.backoff import Backoff
+
+logger = logging.getLogger(__name__)
+
+
+class BreakerState(Enum):
+    CLOSED = 0
+    OPEN = 1
+    HALF_OPEN = 2
+
+
+class Breaker:
+    def __init__(self, name: str, threshold: int = 3, backoff: Backoff | None = None):
+        self.name: str = name
+        self.threshold: int = threshold
+        self.backoff: Backoff = backoff if backoff is not None else Backoff(initial=5.0, maximum=600.0)
+        self.state: BreakerState = BreakerState.CLOSED
+        self.failures: int = 0
+        self.retry_at: float | None = None
+
+    @property
+    def retry_in(self) -> float | None:
+        if self.retry_at is None:
+            return None
+        return max(0.0, self.retry_at - time.monotonic())
+
+    def allow(self) -> bool:
+        match self.state:
+            case BreakerState.CLOSED:
+                return True
+            case BreakerState.OPEN:
+                if time.monotonic() < self.retry_at:
+                    return False
+                # 只放行一次试探, 结果出来之前其余请求仍被拒绝
+                self.state = BreakerState.HALF_OPEN
+                logger.info(f'{self.name} 开始试探性恢复')
+                return True
+            case _:
+                return False
+
+    def success(self):
+        if self.state != BreakerState.CLOSED:
+            logger.info(f'{self.name} 已恢复')
+        self.state = BreakerState.CLOSED
+        self.failures = 0
+        self.retry_at = None
+        self.backoff.reset()
+
+    def failure(self):
+        self.failures += 1
+        if self.state == BreakerState.CLOSED and self.failures < self.threshold:
+            return
+        delay = self.backoff.next()
+        self.state = BreakerState.OPEN
+        self.retry_at = time.monotonic() + delay
+        logger.warning(f'{self.name} 连续失败 {self.failures} 次, 暂停 {delay:.1f}s')
@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import os
+import sys
+import time
+from asyncio import Future, Lock, Queue, Semaphore, Task
+from typing import Any, Dict, Tuple
+
+from pymodbus.client import AsyncModbusSerialClient, AsyncModbusTcpClient
+from pymodbus.client.base import ModbusBaseClient
+from pymodbus.framer.rtu_framer import ModbusRtuFramer
+from pymodbus.framer.socket_framer import ModbusSocketFramer
+from pymodbus.pdu import ModbusResponse
+
+from client.network.breaker import Breaker, BreakerState
+from client.network.profile import Profiles
+
+logger = logging.getLogger(__name__)
+functions = {
+    3: 'read_holding_registers',
+    4: 'read_input_registers'
+}
+
+
+class CheckedRtuFramer(ModbusRtuFramer):
+    def __init__(self, decoder, client=None):
+        # pymodbus 丢弃校验失败的帧而不抛出异常, 请求最终以超时结束, 记录次数以区分 CRC 错误与设备无响应
+        super().__init__(decoder, client)
+        self.crc_errors: int = 0
+
+    def checkFrame(self) -> bool:
+        valid = super().checkFrame()
+        if not valid:
+            self.crc_errors += 1
+        return valid
+
+
+class Bus:
+    def __init__(self, port: str, client: ModbusBaseClient, gap: float = 0.0, merge_gap: int = 0,
+                 pipeline: int = 1, address: Tuple[str, int] | None = None):
+        self.port: str = port
+        self.client: ModbusBaseClient = client
+        self.breaker: Breaker = Breaker(f'总线 {port}', threshold=1)
+        self.gap: float = gap
+        self.merge_gap: int = merge_gap
+        # 大于 1 时请求不经过队列, 由 Modbus TCP 的事务标识符区分并发的响应
+        self.pipeline: int = pipeline
+        self.address: Tuple[str, int] | None = address
+        # 实际发起的连接次数, 断路器拒绝的连接不计入
+        self.attempts: int = 0
+        self.__queue: Queue[Tuple[Future, int, int, int, int]] = Queue()
+        self.__lock: Lock = Lock()
+        self.__semaphore: Semaphore = Semaphore(pipeline)
+        self.__worker: Task[None] | None = None
+        self.__current: Future | None = None
+        self.__last: float = 0.0
+
+    @staticmethod
+    def open(port: str, settings: Dict[str, Any]) -> 'Bus':
+        baudrate = int(settings.get('baudrate', 9600))
+        bytesize = int(settings.get('bytesize', 8))
+        parity = str(settings.get('parity', 'N'))
+        stopbits = int(settings.get('stopbits', 1))
+        turnaround = float(settings.get('turnaround', 0.02))
+        # 重连由断路器负责, 关闭 pymodbus 自带的后台重连
+        options: Dict[str, Any] = {'reconnect_delay': 0}
+        for key in ('timeout', 'retries'):
+            if key in settings:
+                options[key] = settings[key]
+
+        # Modbus RTU 帧间需至少保持 3.5 个字符的静默时间, 19200 波特率以上固定为 1.75ms
+        bits = 1 + bytesize + (0 if parity == 'N' else 1) + stopbits
+        gap = 3.5 * bits / baudrate if baudrate <= 19200 else 0.00175
+        # 额外一次请求的开销: 请求帧 8 字节, 响应帧头与校验 5 字节, 两次帧间静默以及设备响应时间
+        # 每多读一个寄存器需多传输 2 字节, 间隔小于该数量的寄存器时合并读取更省时
+        # 网关后的设备仍然使用串行总线, 因此同样按照下游总线的参数计算
+        char = bits / baudrate
+        merge_gap = int((13 * char + 2 * gap + turnaround) / (2 * char))
+
+        scheme, _, target = port.partition('://')
+        if target == '':
+            client = AsyncModbusSerialClient(port=port, framer=CheckedRtuFramer, baudrate=baudrate,
+                                             bytesize=bytesize, parity=parity, stopbits=stopbits, **options)
+            return Bus(port, client, gap, merge_gap)
+        host, _, number = target.rpartition(':')
+        address = (host, int(number) if number else 502)
+        match scheme:
+            case 'tcp':
+                client = AsyncModbusTcpClient(address[0], port=address[1], framer=ModbusSocketFramer, **options)
+                return Bus(port, client, 0.0, merge_gap, int(settings.get('pipeline', 8)), address)
+            case 'rtu+tcp':
+                # RTU 帧没有事务标识符, 仍需逐个发送, 帧间静默由网关负责
+                client = AsyncModbusTcpClient(address[0], port=address[1], framer=CheckedRtuFramer, **options)
+                return Bus(port, client, float(settings.get('gap', 0.0)), merge_gap, 1, address)
+            case _:
+                raise ValueError(f'不支持的总线类型: {scheme}')
+
+    @property
+    def connected(self) -> bool:
+        return self.client.connected
+
+    @property
+    def crc_errors(self) -> int:
+        return getattr(self.client.framer, 'crc_errors', 0)
+
+    @property
+    def pending(self) -> int:
+        return self.__queue.qsize()
+
+    @property
+    def state(self) -> BreakerState:
+        return self.breaker.state
+
+    async def probe(self) -> bool:
+        if self.address is not None:
+            # 仅尝试建立 TCP 连接, 不经过 pymodbus 的完整连接流程
+            try:
+                _, writer = await asyncio.wait_for(asyncio.open_connection(*self.address), 2.0)
+            except (OSError, asyncio.TimeoutError):
+                return False
+            writer.close()
+            return True
+        # USB 转 485 适配器拔出后设备文件随之消失, 检查文件是否存在即可避免一次完整的连接超时
+        if sys.platform.startswith('win'):
+            return True
+        return os.path.exists(self.port)
+
+    async def connect(self) -> bool:
+        async with self.__lock:
+            if self.connected:
+                return True
+            if not self.breaker.allow():
+                return False
+            self.attempts += 1
+            try:
+                if self.breaker.state == BreakerState.HALF_OPEN and not await self.probe():
+                    self.breaker.failure()
+                    return False
+                try:
+                    await self.client.connect()
+                except Exception as ex:
+                    logger.warning(f'连接总线 {self.port} 时遇到问题: {ex}')
+            except BaseException:
+                # 被轮询的截止时间取消时同样记为失败, 否则断路器停留在试探状态, 之后不再放行任何连接
+                self.breaker.failure()
+                raise
+            if self.connected:
+                self.breaker.success()
+            else:
+                self.breaker.failure()
+            return self.connected
+
+    async def close(self):
+        if self.__worker is not None:
+            self.__worker.cancel()
+            self.__worker = None
+        if self.__current is not None and not self.__current.done():
+            self.__current.cancel()
+        while not self.__queue.empty():
+            future, *_ = self.__queue.get_nowait()
+            if not future.done():
+                future.cancel()
+        await self.client.close()
+
+    async def read(self, slave: int, address: int, count: int, function: int = 3) -> ModbusResponse:
+        if function not in functions:
+            raise ValueError(f'不支持的功能码: {function}')
+        if self.pipeline > 1:
+            async with self.__semaphore:
+                # noinspection PyUnresolvedReferences
+                return await getattr(self.client, functions[function])(address, count, slave)
+        if self.__worker is None or self.__worker.done():
+            self.__worker = asyncio.create_task(self.__work())
+        future = asyncio.get_running_loop().create_future()
+        await self.__queue.put((future, slave, function, address, count))
+        return await future
+
+    async def __work(self):
+        while True:
+            future, slave, function, address, count = await self.__queue.get()
+            if future.done():
+                continue
+            self.__current = future
+            delay = self.__last + self.gap - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                # noinspection PyUnresolvedReferences
+                response = await getattr(self.client, functions[function])(address, count, slave)
+            except Exception as ex:
+                if not future.done():
+                    future.set_exception(ex)
+            else:
+                if not future.done():
+                    future.set_result(response)
+            finally:
+                self.__current = None
+                self.__last = time.monotonic()
+
+
+class Buses:
+    def __init__(self):
+        self.buses: Dict[str, Bus] = {}
+
+    def get(self, port: str) -> Bus:
+        bus = self.buses.get(port, None)
+        if bus is None:
+            bus = Bus.open(port, Profiles().port(port))
+            self.buses[port] = bus
+            logger.info(f'创建总线 {port}')
+        return bus
+
+    async def close(self):
+        for port, bus in self.buses.items():
+            try:
+                await bus.close()
+            except Exception as ex:
+                logger.error(f'关闭总线 {port} 时遇到问题: {ex}', exc_info=ex)
+        self.buses.clear()
@@ -0,0 +1,58 @@
+import logging
+from datetime import timezone
+from typing import Any, Dict, List
+
+from client.network.serializable import Sensor, SensorStructure
+
+logger = logging.getLogger(__name__)
+
+
+class Handles:
+    def __init__(self, sensors: List[Sensor], structures: Dict[str, SensorStructure]):
+        # 句柄为传感器在 sensors 中的位置, 槽位为字段在传感器结构中的位置, 只在当前连接内有效
+        self.sensors: List[str] = []
+        self.handles: Dict[str, int] = {}
+        self.slots: Dict[str, Dict[str, int]] = {}
+        for sensor in sensors:
+            structure = structures.get(sensor.type, None)
+            if structure is None or sensor.id in self.handles:
+                continue
+            self.handles[sensor.id] = len(self.sensors)
+            self.sensors.append(sensor.id)
+            self.slots[sensor.id] = {x: i for i, x in enumerate(structure.fields.keys())}
+
+    def row(self, report) -> List[Any] | None:
+        # [序号, 句柄, 毫秒时间戳, 字段掩码, 按槽位排列的数值...], 无法用句柄表示时返回 None
+        content = report.report
+        handle = self.handles.get(content.sensorId, None)
+        if handle is None or report.merged:
+            # 紧凑格式无法携带被合并的序号
+            return None
+        slots = self.slots[content.sensorId]
+        if any(x not in slots for x in content.fields.keys()):
+            return None
+        values = sorted((slots[x], y) for x, y in content.fields.items())
+        mask = 0
+        for slot, _ in values:
+            mask |= 1 << slot
+        # 与 JSON 格式一致, 时间戳按 UTC 解释, 不受本机时区影响
+        timestamp = int(content.timestamp.replace(tzinfo=timezone.utc).timestamp() * 1000)
+        return [report.index, handle, timestamp, mask, *(y for _, y in values)]
+
+    def compact(self, packet):
+        # 返回等价的 CompactReports, 其中任意一条报告无法压缩时返回 None 并按原格式发送
+        from client.network.serializable.packet import Report, ReportBatch, CompactReports
+        if isinstance(packet, ReportBatch):
+            node, reports = packet.nodeId, list(packet.reports)
+        elif isinstance(packet, Report):
+            node, reports = packet.report.nodeId, [packet]
+        else:
+            return None
+        rows = []
+        for report in reports:
+            row = self.row(report)
+            if row is None:
+                logger.debug(f'报告 #{report.index} 无法使用紧凑格式')
+                return None
+            rows.append(row)
+        return CompactReports(node, rows)
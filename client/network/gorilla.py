@@ -0,0 +1,170 @@
+import struct
+from typing import Tuple
+
+import numpy
+from numpy import ndarray
+
+# 时间戳二阶差分的编码区间: (前缀, 前缀位数, 数值位数), 超出范围时使用 '1111' 加 64 位原值
+ranges = [
+    (0b10, 2, 7),
+    (0b110, 3, 9),
+    (0b1110, 4, 12)
+]
+
+
+def to_bits(value: float) -> int:
+    return struct.unpack('>Q', struct.pack('>d', value))[0]
+
+
+def from_bits(bits: int) -> float:
+    return struct.unpack('>d', struct.pack('>Q', bits))[0]
+
+
+class BitWriter:
+    def __init__(self):
+        self.buffer: bytearray = bytearray()
+        self.__bits: int = 0
+        self.__count: int = 0
+
+    def __len__(self) -> int:
+        return len(self.buffer) * 8 + self.__count
+
+    def write(self, value: int, bits: int):
+        self.__bits = (self.__bits << bits) | (value & ((1 << bits) - 1))
+        self.__count += bits
+        while self.__count >= 8:
+            self.__count -= 8
+            self.buffer.append((self.__bits >> self.__count) & 0xFF)
+        self.__bits &= (1 << self.__count) - 1
+
+    def to_bytes(self) -> bytes:
+        if self.__count <= 0:
+            return bytes(self.buffer)
+        return bytes(self.buffer) + bytes([(self.__bits << (8 - self.__count)) & 0xFF])
+
+
+class BitReader:
+    def __init__(self, data: bytes):
+        self.__data: bytes = data
+        self.__length: int = len(data) * 8
+        self.__position: int = 0
+
+    def read(self, bits: int) -> int:
+        end = self.__position + bits
+        if end > self.__length:
+            raise ValueError('数据块已损坏')
+        first, last = self.__position >> 3, (end + 7) >> 3
+        self.__position = end
+        return (int.from_bytes(self.__data[first:last], 'big') >> ((last << 3) - end)) & ((1 << bits) - 1)
+
+    def flag(self) -> bool:
+        return self.read(1) == 1
+
+
+class Chunk:
+    def __init__(self):
+        # 时间戳使用二阶差分, 数值与前一个值按位异或后只写入有效位, 参考 Gorilla 的编码方式
+        self.writer: BitWriter = BitWriter()
+        self.count: int = 0
+        self.start: int | None = None
+        self.end: int | None = None
+        self.minimum: float | None = None
+        self.maximum: float | None = None
+        self.total: float = 0.0
+        self.__delta: int = 0
+        self.__value: int = 0
+        self.__leading: int = -1
+        self.__trailing: int = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def to_bytes(self) -> bytes:
+        return self.writer.to_bytes()
+
+    def append(self, timestamp: int, value: float):
+        if self.end is not None and timestamp <= self.end:
+            raise ValueError(f'时间戳 {timestamp} 不晚于数据块中的最后一个时间戳 {self.end}')
+        bits = to_bits(value)
+        if self.count <= 0:
+            self.writer.write(timestamp, 64)
+            self.writer.write(bits, 64)
+            self.start = timestamp
+            self.minimum = value
+            self.maximum = value
+        else:
+            delta = timestamp - self.end
+            self.__timestamp(delta - self.__delta)
+            self.__delta = delta
+            self.__xor(bits ^ self.__value)
+            self.minimum = min(self.minimum, value)
+            self.maximum = max(self.maximum, value)
+        self.end = timestamp
+        self.total += value
+        self.__value = bits
+        self.count += 1
+
+    def __timestamp(self, dod: int):
+        if dod == 0:
+            self.writer.write(0, 1)
+            return
+        for prefix, length, bits in ranges:
+            if -(1 << (bits - 1)) < dod <= (1 << (bits - 1)):
+                self.writer.write(prefix, length)
+                self.writer.write(dod, bits)
+                return
+        self.writer.write(0b1111, 4)
+        self.writer.write(dod, 64)
+
+    def __xor(self, xor: int):
+        if xor == 0:
+            self.writer.write(0, 1)
+            return
+        leading = min(31, 64 - xor.bit_length())
+        trailing = (xor & -xor).bit_length() - 1
+        if self.__leading >= 0 and leading >= self.__leading and trailing >= self.__trailing:
+            # 有效位落在上一个窗口内, 沿用窗口
+            self.writer.write(0b10, 2)
+            self.writer.write(xor >> self.__trailing, 64 - self.__leading - self.__trailing)
+            return
+        length = 64 - leading - trailing
+        self.writer.write(0b11, 2)
+        self.writer.write(leading, 5)
+        self.writer.write(length - 1, 6)
+        self.writer.write(xor >> trailing, length)
+        self.__leading = leading
+        self.__trailing = trailing
+
+
+def signed(value: int, bits: int) -> int:
+    return value - (1 << bits) if value > (1 << (bits - 1)) else value
+
+
+def decode(data: bytes, count: int) -> Tuple[ndarray, ndarray]:
+    timestamps = numpy.zeros(count, dtype=numpy.int64)
+    values = numpy.zeros(count, dtype=numpy.float64)
+    if count <= 0:
+        return timestamps, values
+    reader = BitReader(data)
+    timestamp = signed(reader.read(64), 64)
+    bits = reader.read(64)
+    timestamps[0] = timestamp
+    values[0] = from_bits(bits)
+    delta, leading, trailing = 0, 0, 0
+    for index in range(1, count):
+        if reader.flag():
+            for prefix, length, width in ranges:
+                if not reader.flag():
+                    delta += signed(reader.read(width), width)
+                    break
+            else:
+                delta += signed(reader.read(64), 64)
+        timestamp += delta
+        timestamps[index] = timestamp
+        if reader.flag():
+            if reader.flag():
+                leading = reader.read(5)
+                trailing = 64 - leading - (reader.read(6) + 1)
+            bits ^= reader.read(64 - leading - trailing) << trailing
+        values[index] = from_bits(bits)
+    return timestamps, values
@@ -0,0 +1,67 @@
+import asyncio
+import logging
+import time
+from asyncio import Semaphore, Task
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Set, Tuple
+
+from client.network.metrics import Metrics, IncomingMetrics
+
+logger = logging.getLogger(__name__)
+
+
+class Dispatcher:
+    def __init__(self, concurrency: int = 8, slow: float = 1.0, metrics: IncomingMetrics | None = None):
+        # 相同 key 的数据包按到达顺序依次执行, 不同 key 之间并发执行, 同时执行的数量不超过 concurrency
+        # 执行时间超过 slow 秒时记录警告
+        self.concurrency: int = concurrency
+        self.slow: float = slow
+        self.metrics: IncomingMetrics = metrics if metrics is not None else Metrics().incoming
+        self.__semaphore: Semaphore | None = None
+        self.__lanes: Dict[str, Deque[Tuple[str, Callable[[], Awaitable[None]]]]] = {}
+        self.__tasks: Set[Task[None]] = set()
+
+    def __len__(self) -> int:
+        return sum(len(x) for x in self.__lanes.values())
+
+    def dispatch(self, key: str, name: str, handler: Callable[[], Awaitable[None]]):
+        # 只在事件循环线程中调用, 不等待执行结果
+        if self.__semaphore is None:
+            self.__semaphore = Semaphore(self.concurrency)
+        lane = self.__lanes.get(key, None)
+        if lane is None:
+            lane = self.__lanes[key] = deque()
+            task = asyncio.get_running_loop().create_task(self.__drain(key, lane))
+            self.__tasks.add(task)
+            task.add_done_callback(self.__tasks.discard)
+        lane.append((name, handler))
+        self.metrics.pending = len(self)
+
+    async def __drain(self, key: str, lane: Deque[Tuple[str, Callable[[], Awaitable[None]]]]):
+        try:
+            while len(lane) > 0:
+                name, handler = lane[0]
+                async with self.__semaphore:
+                    timestamp = time.monotonic()
+                    try:
+                        await handler()
+                    except Exception as ex:
+                        self.metrics.failure(name)
+                        logger.error(f'执行数据包 {name} 时遇到错误: {ex}', exc_info=ex)
+                        # TODO maybe message box
+                    elapsed = time.monotonic() - timestamp
+                lane.popleft()
+                self.metrics.observe(name, elapsed)
+                self.metrics.pending = len(self)
+                if elapsed >= self.slow:
+                    logger.warning(f'执行数据包 {name} 耗时 {int(elapsed * 1000)}ms')
+        finally:
+            self.__lanes.pop(key, None)
+
+    async def cancel(self):
+        tasks = list(self.__tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.__lanes.clear()
+        self.metrics.pending = 0
@@ -0,0 +1,232 @@
+import json
+import logging
+import os
+import time
+from bisect import bisect_left
+from datetime import datetime
+from threading import Lock
+from typing import Any, Dict, List
+
+from client.abstract.meta import Singleton
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    # 延迟分桶上限(毫秒), 最后一个桶收集超出上限的样本
+    bounds: List[float] = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+
+    def __init__(self):
+        self.counts: List[int] = [0] * (len(self.bounds) + 1)
+        self.count: int = 0
+        self.total: float = 0.0
+        self.maximum: float = 0.0
+
+    def observe(self, seconds: float):
+        value = seconds * 1000
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.maximum = max(self.maximum, value)
+
+    @property
+    def mean(self) -> float | None:
+        return self.total / self.count if self.count > 0 else None
+
+    def quantile(self, ratio: float) -> float | None:
+        # 返回所在分桶的上限, 精度取决于分桶划分
+        if self.count <= 0:
+            return None
+        target = self.count * ratio
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return self.bounds[index] if index < len(self.bounds) else self.maximum
+        return self.maximum
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'mean': self.mean,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'max': self.maximum,
+            'buckets': {str(bound): count for bound, count in zip(self.bounds + ['inf'], self.counts)}
+        }
+
+
+class DeviceMetrics:
+    def __init__(self, name: str):
+        self.name: str = name
+        self.latency: Histogram = Histogram()
+        self.requests: int = 0
+        self.successes: int = 0
+        self.timeouts: int = 0
+        self.crc_errors: int = 0
+        self.invalid: int = 0
+        self.errors: int = 0
+        self.reconnects: int = 0
+        self.last_success: float | None = None
+        self.last_error: str | None = None
+
+    def success(self, seconds: float):
+        self.requests += 1
+        self.successes += 1
+        self.latency.observe(seconds)
+        self.last_success = time.time()
+
+    def timeout(self):
+        self.requests += 1
+        self.timeouts += 1
+        self.last_error = 'timeout'
+
+    def failure(self, ex: Exception, crc: bool = False):
+        # crc 由调用方根据总线的校验失败计数判断, pymodbus 的异常本身不区分 CRC 错误
+        self.requests += 1
+        message = str(ex)
+        if crc:
+            self.crc_errors += 1
+        elif isinstance(ex, TimeoutError):
+            self.timeouts += 1
+        else:
+            self.errors += 1
+        self.last_error = f'{type(ex).__name__}: {message}'
+
+    def invalidate(self, response: Any):
+        self.requests += 1
+        self.invalid += 1
+        self.last_error = f'invalid: {type(response).__name__}'
+
+    def reconnect(self):
+        self.reconnects += 1
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            'requests': self.requests,
+            'successes': self.successes,
+            'timeouts': self.timeouts,
+            'crc_errors': self.crc_errors,
+            'invalid': self.invalid,
+            'errors': self.errors,
+            'reconnects': self.reconnects,
+            'last_success': datetime.fromtimestamp(self.last_success).isoformat() if self.last_success else None,
+            'last_error': self.last_error,
+            'latency': self.latency.to_json()
+        }
+
+
+class OutboundMetrics:
+    def __init__(self):
+        self.depth: int = 0
+        self.peak: int = 0
+        self.enqueued: int = 0
+        self.packets: int = 0
+        self.frames: int = 0
+        self.failures: int = 0
+        self.blocked: int = 0
+        self.dropped: int = 0
+        self.merged: int = 0
+        # 各优先级的数据包在发送队列中等待的时间
+        self.waits: Dict[str, Histogram] = {}
+
+    def enqueue(self, depth: int):
+        self.enqueued += 1
+        self.depth = depth
+        self.peak = max(self.peak, depth)
+
+    def observe(self, priority: str, seconds: float):
+        histogram = self.waits.get(priority, None)
+        if histogram is None:
+            histogram = self.waits.setdefault(priority, Histogram())
+        histogram.observe(seconds)
+
+    def write(self, packets: int, success: bool):
+        self.frames += 1
+        self.packets += packets
+        if not success:
+            self.failures += 1
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            'depth': self.depth,
+            'peak': self.peak,
+            'enqueued': self.enqueued,
+            'packets': self.packets,
+            'frames': self.frames,
+            'failures': self.failures,
+            'blocked': self.blocked,
+            'dropped': self.dropped,
+            'merged': self.merged,
+            'waits': {x: y.to_json() for x, y in list(self.waits.items())}
+        }
+
+
+class IncomingMetrics:
+    def __init__(self):
+        self.pending: int = 0
+        self.failures: Dict[str, int] = {}
+        # 各类数据包的执行时间
+        self.handlers: Dict[str, Histogram] = {}
+
+    def observe(self, name: str, seconds: float):
+        histogram = self.handlers.get(name, None)
+        if histogram is None:
+            histogram = self.handlers.setdefault(name, Histogram())
+        histogram.observe(seconds)
+
+    def failure(self, name: str):
+        self.failures[name] = self.failures.get(name, 0) + 1
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            'pending': self.pending,
+            'failures': dict(self.failures),
+            'handlers': {x: y.to_json() for x, y in list(self.handlers.items())}
+        }
+
+
+class Metrics(metaclass=Singleton):
+    def __init__(self):
+        self.devices: Dict[str, DeviceMetrics] = {}
+        self.outbound: OutboundMetrics = OutboundMetrics()
+        self.incoming: IncomingMetrics = IncomingMetrics()
+        self.__lock: Lock = Lock()
+
+    def device(self, name: str) -> DeviceMetrics:
+        metrics = self.devices.get(name, None)
+        if metrics is None:
+            with self.__lock:
+                metrics = self.devices.setdefault(name, DeviceMetrics(name))
+        return metrics
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self.__lock:
+            devices = list(self.devices.values())
+        return {x.name: x.to_json() for x in devices}
+
+    def slowest(self, count: int = 5) -> List[DeviceMetrics]:
+        with self.__lock:
+            devices = list(self.devices.values())
+        return sorted(devices, key=lambda x: x.latency.quantile(0.95) or 0.0, reverse=True)[:count]
+
+    def dump(self, path: str | None = None) -> str:
+        if path is None:
+            os.makedirs('logs', exist_ok=True)
+            path = os.path.join('logs', f'metrics-{datetime.now().strftime("%Y%m%d-%H%M%S")}.json')
+        with open(path, 'w') as file:
+            snapshot = {'devices': self.snapshot(), 'outbound': self.outbound.to_json(),
+                        'incoming': self.incoming.to_json()}
+            json.dump(snapshot, file, ensure_ascii=False, indent=2)
+        for metrics in self.slowest():
+            logger.info(f'设备 {metrics.name}: 请求 {metrics.requests}, 超时 {metrics.timeouts}, '
+                        f'p95 {metrics.latency.quantile(0.95)}ms, 最近错误 {metrics.last_error}')
+        outbound = self.outbound
+        logger.info(f'发送队列: 当前 {outbound.depth}, 峰值 {outbound.peak}, 丢弃 {outbound.dropped}, 合并 {outbound.merged}')
+        for priority, histogram in list(outbound.waits.items()):
+            logger.info(f'发送队列 {priority}: 数量 {histogram.count}, p95 等待 {histogram.quantile(0.95)}ms')
+        for name, histogram in list(self.incoming.handlers.items()):
+            logger.info(f'数据包 {name}: 执行 {histogram.count}, p95 {histogram.quantile(0.95)}ms, 最长 {histogram.maximum}ms')
+        logger.info(f'已导出设备指标至 {path}')
+        return path
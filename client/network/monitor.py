@@ -1,43 +1,75 @@
 import asyncio
-import copy
 import logging
-import struct
 import time
-from asyncio import Event, AbstractEventLoop
+from asyncio import Event, AbstractEventLoop, TimerHandle
 from concurrent.futures import Future
 from datetime import datetime
 from threading import Thread
-from typing import Tuple, List, Dict
+from typing import Callable, List, Dict, Set, Tuple
 
-from pymodbus.client import AsyncModbusSerialClient
-from pymodbus.register_read_message import ReadHoldingRegistersResponse
+import numpy
+from numpy import ndarray
+
+from pymodbus.register_read_message import ReadRegistersResponseBase
 
 from client.abstract.meta import Singleton
+from client.network.breaker import Breaker, BreakerState
+from client.network.bus import Bus, Buses
+from client.network.metrics import DeviceMetrics, Metrics
+from client.network.outbox import Outbox
+from client.network.policy import Reporter
+from client.network.profile import DeviceProfile, Decoder, Profiles
+from client.network.rollup import Rollup, offset
+from client.network.scheduler import Scheduler
+from client.network.storage import Storage
 from client.network.serializable import Sensor, SensorStructure
-from client.network.websocket import Client
 from client.ui.window import MainWindow
 
 logger = logging.getLogger(__name__)
-commands = {
-    'TNET_100': (100, 24, 33)
-}
+aggregations = ('mean', 'min', 'max', 'sum', 'count')
 
 
 class Monitor:
-    def __init__(self, sensor: Sensor, structure: SensorStructure):
+    def __init__(self, sensor: Sensor, structure: SensorStructure, profile: DeviceProfile, bus: Bus, slave: int):
         self.sensor: Sensor = sensor
         self.structure: SensorStructure = structure
-        self.command: Tuple[int, int, int] = commands[sensor.type]
-        self.client: AsyncModbusSerialClient = AsyncModbusSerialClient(port=self.sensor.port,
-                                                                       baudrate=9600, bytesize=8,
-                                                                       parity='N', stopbits=1)
-        self.payload: List[float] | None = None
+        self.profile: DeviceProfile = profile
+        self.interval, self.jitter = Profiles().interval(sensor.name, profile)
+        self.bus: Bus = bus
+        self.slave: int = slave
+        self.breaker: Breaker = Breaker(f'设备 {sensor.name}')
+        self.metrics: DeviceMetrics = Metrics().device(sensor.name)
+        self.reporter: Reporter = Reporter(Profiles().report(sensor.name, sensor.type))
+        self.payload: List[float | None] | None = None
         self.timestamp: datetime | None = None
-        self.history: Dict[str, Dict[datetime, float]] = {}
+        self.rollups: Dict[str, Rollup] = {}
+
+    @property
+    def enabled(self) -> List[str] | None:
+        fields = self.sensor.fields
+        if fields is None or len(fields) <= 0 or all(fields.values()):
+            return None
+        return [x for x in self.structure.fields.keys() if fields.get(x, True)]
+
+    @property
+    def decoder(self) -> Decoder:
+        return self.profile.decoder(list(self.structure.fields.keys()), self.enabled, self.bus.merge_gap)
 
     @property
     def is_online(self) -> bool:
-        return self.client.connected
+        return self.bus.connected
+
+    @property
+    def state(self) -> BreakerState:
+        if self.bus.state != BreakerState.CLOSED:
+            return self.bus.state
+        return self.breaker.state
+
+    @property
+    def retry_in(self) -> float | None:
+        if self.bus.state != BreakerState.CLOSED:
+            return self.bus.breaker.retry_in
+        return self.breaker.retry_in
 
     @property
     def last_values(self) -> Dict[str, float] | None:
@@ -50,88 +82,197 @@ class Monitor:
     def last_update(self) -> datetime | None:
         return self.timestamp
 
-    def match(self, values: List[float]) -> Dict[str, float]:
-        return dict(filter(lambda x: x[1] != 0.0, zip(self.structure.fields.keys(), values)))
+    def match(self, values: List[float | None]) -> Dict[str, float]:
+        return dict(filter(lambda x: x[1] is not None and x[1] != 0.0, zip(self.structure.fields.keys(), values)))
 
     def record(self):
-        timestamp = copy.deepcopy(self.last_update)
-        timestamp.replace(second=0, microsecond=0)
+        timestamp = int(self.last_update.timestamp())
         values = self.last_values
+        storage = Storage()
         for key, value in values.items():
-            records = self.history.get(key, {})
-            delta = None
-            if len(records) > 0:
-                delta = timestamp - max(records.keys())
-            if delta is not None and delta.total_seconds() < 60:
-                continue
-            records[timestamp] = value
-            if len(records) > 60:
-                records = {x[0]: x[1] for x in records.items() if (timestamp - x[0]).total_seconds() < 3600}
-            self.history[key] = records
-        for key in list(filter(lambda x: x not in values, self.history.keys())):
-            self.history.pop(key)
+            storage.write(self.sensor.id, key, timestamp, value)
+            rollup = self.rollups.get(key, None)
+            if rollup is None:
+                rollup = Rollup()
+                self.rollups[key] = rollup
+            rollup.add(timestamp, value)
+
+    def restore(self):
+        # 从本地存储恢复各级聚合数据, 在开始轮询之前调用
+        storage = Storage()
+        now = int(time.time())
+        for key in self.structure.fields.keys():
+            rollup = Rollup()
+            for tier in rollup.tiers:
+                for bucket in storage.aggregate(self.sensor.id, key, now - tier.span, now, tier.width, tier.offset):
+                    tier.merge(*bucket)
+            if len(rollup.tiers[-1]) > 0:
+                self.rollups[key] = rollup
+
+    def query(self, field: str, start: int, end: int, step: int, agg: str = 'mean') -> Tuple[ndarray, ndarray]:
+        # 返回 [start, end) 内按 step 对齐的桶起始时间与聚合值, 没有数据的桶为 NaN (count 为 0)
+        if agg not in aggregations:
+            raise ValueError(f'不支持的聚合方式: {agg}')
+        if step <= 0:
+            raise ValueError(f'无效的步长: {step}')
+        start = start - (start + offset()) % step
+        grid = numpy.arange(start, end, step, dtype=numpy.int64)
+        timestamps, minimum, maximum, total, count = self.__buckets(field, start, end, step)
+        indexes = (timestamps - start) // step
+        mask = (indexes >= 0) & (indexes < len(grid))
+        indexes = indexes[mask]
+        counts = numpy.bincount(indexes, weights=count[mask], minlength=len(grid))
+        if agg == 'count':
+            return grid, counts.astype(numpy.int64)
+        empty = counts <= 0
+        match agg:
+            case 'min':
+                values = numpy.full(len(grid), numpy.inf)
+                numpy.minimum.at(values, indexes, minimum[mask])
+            case 'max':
+                values = numpy.full(len(grid), -numpy.inf)
+                numpy.maximum.at(values, indexes, maximum[mask])
+            case 'sum':
+                values = numpy.bincount(indexes, weights=total[mask], minlength=len(grid))
+            case _:
+                values = numpy.bincount(indexes, weights=total[mask], minlength=len(grid))
+                values[~empty] /= counts[~empty]
+        values[empty] = numpy.nan
+        return grid, values
+
+    def __buckets(self, field: str, start: int, end: int,
+                  step: int) -> Tuple[ndarray, ndarray, ndarray, ndarray, ndarray]:
+        # 优先使用内存中能整除步长的聚合数据, 超出其保留范围时读取本地存储, 步长过小时读取原始样本
+        rollup = self.rollups.get(field, None)
+        tier = rollup.tier(step) if rollup is not None else None
+        if tier is None:
+            timestamps, values = Storage().read(self.sensor.id, field, start, end)
+            return timestamps, values, values, values, numpy.ones(len(values), dtype=numpy.int64)
+        if start >= int(time.time()) - tier.span:
+            with rollup.lock:
+                views = tier.window(start, end)
+                return tuple(numpy.array(x) for x in views)
+        buckets = Storage().aggregate(self.sensor.id, field, start, end, tier.width, tier.offset)
+        if len(buckets) <= 0:
+            return (numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0), numpy.zeros(0), numpy.zeros(0),
+                    numpy.zeros(0, dtype=numpy.int64))
+        columns = list(zip(*buckets))
+        return (numpy.array(columns[0], dtype=numpy.int64), numpy.array(columns[1]), numpy.array(columns[2]),
+                numpy.array(columns[3]), numpy.array(columns[4], dtype=numpy.int64))
 
     async def connect(self):
-        await self.client.connect()
-
-    async def close(self):
-        await self.client.close()
+        await self.bus.connect()
 
-    async def pull(self) -> List[float] | None:
+    async def pull(self) -> List[float | None] | None:
         if not self.is_online:
+            attempts = self.bus.attempts
             await self.connect()
+            if self.bus.attempts > attempts:
+                self.metrics.reconnect()
         if not self.is_online:
             return None
-        timestamp = time.time()
-        # noinspection PyUnresolvedReferences
-        response = await self.client.read_holding_registers(*self.command)
-        if not isinstance(response, ReadHoldingRegistersResponse):
-            logger.warning(f'与设备通信时收到的响应无效: ({type(response).__name__}) {response}')
+        if not self.breaker.allow():
             return None
-        payload = response.encode()
+        timestamp = time.time()
+        payloads = []
+        succeeded = False
+        try:
+            decoder = self.decoder
+            for read in decoder.reads:
+                started = time.monotonic()
+                crc_errors = self.bus.crc_errors
+                try:
+                    response = await self.bus.read(self.slave, read.address, read.count, read.function)
+                except Exception as ex:
+                    logger.warning(f'与设备 {self.sensor.name} 通信时遇到问题: {ex}')
+                    self.metrics.failure(ex, self.bus.crc_errors > crc_errors)
+                    return None
+                if not isinstance(response, ReadRegistersResponseBase) or len(response.registers) != read.count:
+                    logger.warning(f'与设备通信时收到的响应无效: ({type(response).__name__}) {response}')
+                    self.metrics.invalidate(response)
+                    return None
+                self.metrics.success(time.monotonic() - started)
+                payloads.append(response.registers)
+            values = decoder.decode(payloads)
+            succeeded = True
+        finally:
+            # 无论以何种方式结束(包括超时取消)都要给出结果, 否则试探状态的断路器之后不再放行任何请求
+            if succeeded:
+                self.breaker.success()
+            else:
+                self.breaker.failure()
 
-        values = []
-        for index in range(1, payload[0], 4):
-            upper = payload[index:index + 2]
-            lower = payload[index + 2:index + 4]
-            values.append(struct.unpack('>f', lower + upper)[0])
         self.payload = values
         self.timestamp = datetime.now()
         self.record()
         elapsed = int((time.time() - timestamp) * 1000)
-        logger.info(f'获取设备 {self.sensor.name} 报告({elapsed}ms)')
+        logger.debug(f'获取设备 {self.sensor.name} 报告({elapsed}ms)')
         return values
 
-    async def lazy_pull(self):
-        if self.payload is None or self.timestamp is None:
-            return await self.pull()
-        delta = datetime.now() - self.timestamp
-        if delta.total_seconds() >= 60:
-            return await self.pull()
-        return self.payload
-
     async def report(self):
-        datas: List[float] | None = await self.lazy_pull()
+        # 返回本次需要上报的 Report, 由 MonitorThread 合并后发送
+        datas: List[float | None] | None = await self.pull()
         if datas is None:
-            return
+            return None
         fields: Dict[str, float] = self.match(datas)
         logger.info(fields)
+        disabled = [x for x, enabled in self.sensor.fields.items() if not enabled]
         self.sensor.fields.clear()
         self.sensor.fields.update({x: True for x in fields.keys()})
+        self.sensor.fields.update({x: False for x in disabled})
+        fields = self.reporter.filter(fields, time.monotonic())
+        if len(fields) <= 0:
+            return None
         from client.network.serializable import SensorReport
         report = SensorReport(node_id=self.sensor.nodeId, sensor_id=self.sensor.id, model=self.sensor.type,
                               fields=fields, timestamp=datetime.now())
         from client.network.serializable.packet import Report
-        Client().connection.send(Report(report))
+        return Report(report)
+
+
+class CycleSummary:
+    def __init__(self):
+        self.started: float = time.time()
+        self.elapsed: float | None = None
+        self.finished: List[str] = []
+        self.timeout: List[str] = []
+        self.failed: List[str] = []
+        self.offline: List[str] = []
+        self.latency: Dict[str, float] = {}
+
+    def __str__(self) -> str:
+        text = f'完成 {len(self.finished)}, 超时 {len(self.timeout)}, 失败 {len(self.failed)}, 离线 {len(self.offline)}'
+        if len(self.timeout) > 0:
+            text += f', 超时设备: {", ".join(self.timeout)}'
+        if len(self.failed) > 0:
+            text += f', 失败设备: {", ".join(self.failed)}'
+        if len(self.offline) > 0:
+            text += f', 离线设备: {", ".join(self.offline)}'
+        return text
 
 
 class MonitorThread(Thread):
-    def __init__(self, window: MainWindow):
+    def __init__(self, window: MainWindow | None, concurrency: int = 8, deadline: float = 5.0, reporting: bool = True,
+                 linger: float = 0.5):
+        # linger 秒内完成的各轮报告一并发送
         super().__init__()
-        self.window: MainWindow = window
+        self.window: MainWindow | None = window
         self.monitors: Dict[str, Monitor] = {}
+        self.concurrency: int = concurrency
+        self.deadline: float = deadline
+        self.reporting: bool = reporting
+        self.linger: float = linger
+        self.summary: CycleSummary | None = None
+        self.listener: Callable[[CycleSummary], None] | None = None
+        self.buses: Buses = Buses()
+        self.scheduler: Scheduler = Scheduler()
         self.__loop: AbstractEventLoop = asyncio.new_event_loop()
         self.__stop_sign: Event = Event()
+        self.__wake: Event = Event()
+        self.__semaphore: asyncio.Semaphore = asyncio.Semaphore(concurrency)
+        self.__cycles: Set[asyncio.Task] = set()
+        self.__reports: List = []
+        self.__flush: TimerHandle | None = None
         self.__stopped: Future = Future()
 
     @property
@@ -147,9 +288,19 @@ class MonitorThread(Thread):
         return self.__stopped
 
     def end(self):
-        self.__stop_sign.set()
+        self.terminate()
         self.__stopped.result()
 
+    def terminate(self):
+        def stop():
+            self.__stop_sign.set()
+            self.__wake.set()
+
+        if self.is_alive():
+            self.loop.call_soon_threadsafe(stop)
+        else:
+            self.__stop_sign.set()
+
     def run(self) -> None:
         logger.info('线程已启动')
         asyncio.set_event_loop(self.loop)
@@ -157,36 +308,97 @@ class MonitorThread(Thread):
         logger.info('线程准备结束')
 
     async def __corotine(self):
-        from client.ui.page.dashboard import DashboardPage
         logger.info('协程已启动')
-        count = 0
         while not self.stop_sign.is_set():
-            await asyncio.sleep(1)
-            count = count + 1
-            if count < 10:
+            delay = self.scheduler.delay()
+            if delay is None or delay > 0:
+                # 休眠至下一个设备到期, 期间添加设备或停止线程时会被提前唤醒
+                self.__wake.clear()
+                try:
+                    await asyncio.wait_for(self.__wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
                 continue
-            count = 0
-
-            page: DashboardPage | None = None
-            widget = self.window.centralWidget()
-            if isinstance(widget, DashboardPage):
-                page = widget
-            for key, monitor in self.monitors.items():
-                timestamp = time.time()
-                await monitor.report()
-                elapsed = int((time.time() - timestamp) * 1000)
-                logger.info(f'处理设备 {key} 报告({elapsed}ms)')
-                if page is not None:
-                    widget = page.indexes.get(key, None)
-                    if widget is not None:
-                        widget.fetch.emit()
+            keys = self.scheduler.due()
+            if len(keys) <= 0:
+                continue
+            task = self.loop.create_task(self.__cycle(keys))
+            self.__cycles.add(task)
+            task.add_done_callback(self.__cycles.discard)
 
         logger.info('协程准备结束')
-        for key, monitor in self.monitors.items():
-            await monitor.close()
+        for task in list(self.__cycles):
+            task.cancel()
+        if len(self.__cycles) > 0:
+            await asyncio.gather(*self.__cycles, return_exceptions=True)
+        if self.__flush is not None:
+            self.__flush.cancel()
+        self.__send()
+        await self.buses.close()
         logger.info('所有设备已断开连接')
         self.stopped.set_result(None)
 
+    async def __cycle(self, keys: List[str]) -> CycleSummary:
+        from client.ui.page.dashboard import DashboardPage
+        page: DashboardPage | None = None
+        widget = self.window.centralWidget() if self.window is not None else None
+        if isinstance(widget, DashboardPage):
+            page = widget
+
+        summary = CycleSummary()
+
+        async def poll(key: str, monitor: Monitor):
+            async with self.__semaphore:
+                timestamp = time.time()
+                try:
+                    report = await asyncio.wait_for(monitor.report() if self.reporting else monitor.pull(),
+                                                    self.deadline)
+                    if self.reporting and report is not None:
+                        self.__reports.append(report)
+                except asyncio.TimeoutError:
+                    # 设备断路器由 pull 自行记录, 连接总线时的超时由总线断路器负责
+                    monitor.metrics.timeout()
+                    summary.timeout.append(key)
+                    logger.warning(f'处理设备 {key} 报告超时({int(self.deadline * 1000)}ms)')
+                except Exception as ex:
+                    summary.failed.append(key)
+                    logger.error(f'处理设备 {key} 报告时遇到问题: {ex}', exc_info=ex)
+                else:
+                    summary.latency[key] = time.time() - timestamp
+                    elapsed = int(summary.latency[key] * 1000)
+                    if monitor.state != BreakerState.CLOSED or not monitor.is_online:
+                        summary.offline.append(key)
+                        logger.info(f'设备 {key} 处于离线状态({monitor.state.name})')
+                    else:
+                        summary.finished.append(key)
+                        logger.info(f'处理设备 {key} 报告({elapsed}ms)')
+                finally:
+                    self.scheduler.done(key)
+                    self.__wake.set()
+            # 无论成功与否都通知视图刷新, 以便显示设备的连接状态
+            if page is not None:
+                view = page.indexes.get(key, None)
+                if view is not None:
+                    view.fetch.emit()
+
+        monitors = [(key, self.monitors[key]) for key in keys if key in self.monitors]
+        await asyncio.gather(*[poll(key, monitor) for key, monitor in monitors])
+        summary.elapsed = time.time() - summary.started
+        logger.info(f'本轮处理完成({int(summary.elapsed * 1000)}ms): {summary}')
+        self.summary = summary
+        if len(self.__reports) > 0 and self.__flush is None:
+            self.__flush = self.loop.call_later(self.linger, self.__send)
+        if self.listener is not None:
+            self.listener(summary)
+        return summary
+
+    def __send(self):
+        self.__flush = None
+        reports, self.__reports = self.__reports, []
+        # 逐条入队, 队列已满时可以按传感器合并; 写入时仍由 coalesce 打包为 ReportBatch
+        for report in reports:
+            Outbox().send(report)
+
     def monitor(self, sensor: Sensor, structure: SensorStructure) -> Future[None]:
         if not self.is_alive():
             logger.info('线程已经结束, 无法创建监控')
@@ -197,15 +409,33 @@ class MonitorThread(Thread):
         return asyncio.run_coroutine_threadsafe(self.__monitor(sensor, structure), self.loop)
 
     async def __monitor(self, sensor: Sensor, structure: SensorStructure):
-        monitor = Monitor(sensor, structure)
+        profile = Profiles().get(sensor.type)
+        if profile is None:
+            logger.error(f'未找到适用于传感器 {sensor.type} 的设备配置, 无法监控设备 {sensor.name}')
+            return
+        existing = self.monitors.get(sensor.name, None)
+        if existing is not None and existing.sensor.port == sensor.port and existing.sensor.type == sensor.type:
+            # 重新连接后服务端会再次下发配置, 设备未变化时沿用原有的监控与历史数据
+            existing.sensor = sensor
+            existing.structure = structure
+            logger.info(f'继续监控设备 {sensor.name}')
+            return
+        port, _, slave = sensor.port.partition('#')
+        monitor = Monitor(sensor, structure, profile, self.buses.get(port), int(slave) if slave else profile.slave)
+        try:
+            await self.loop.run_in_executor(None, monitor.restore)
+        except Exception as ex:
+            logger.error(f'恢复设备 {sensor.name} 的聚合数据时遇到问题: {ex}', exc_info=ex)
         try:
             await monitor.connect()
         except Exception as ex:
             logger.error(f'连接至设备 {sensor.name} 时遇到问题: {ex}', exc_info=ex)
         self.monitors[sensor.name] = monitor
-        logger.info(f'开始监控设备 {sensor.name}')
+        self.scheduler.add(sensor.name, monitor.interval, monitor.jitter)
+        self.__wake.set()
+        logger.info(f'开始监控设备 {sensor.name} (间隔 {monitor.interval}s)')
 
-    def pull(self, monitor: Monitor) -> Future[List[float] | None]:
+    def pull(self, monitor: Monitor) -> Future[List[float | None] | None]:
         if not self.is_alive():
             logger.info('线程已经结束, 无法获取报告')
             future = Future()
@@ -233,13 +463,23 @@ class Monitors(metaclass=Singleton):
                 return
             logger.info('正在取消先前线程')
             self.thread.end()
+        Storage().launch()
+        Outbox().launch()
         self.thread = MonitorThread(self.window)
         self.thread.start()
 
+    def query(self, sensor: str, field: str, start: int, end: int,
+              step: int, agg: str = 'mean') -> Tuple[ndarray, ndarray] | None:
+        monitor = self.monitors.get(sensor, None)
+        if monitor is None:
+            logger.warning(f'查询历史数据时未找到设备 {sensor}')
+            return None
+        return monitor.query(field, start, end, step, agg)
+
     def stop(self) -> Future[None]:
         if self.thread is None:
             future = Future()
             future.set_result(None)
             return future
-        self.thread.stop_sign.set()
+        self.thread.terminate()
         return self.thread.stopped
@@ -0,0 +1,332 @@
+import logging
+import queue
+import sqlite3
+import time
+from concurrent.futures import Future
+from queue import Queue
+from threading import Lock, Thread
+from typing import List, Tuple
+
+from client.abstract.meta import Singleton
+
+logger = logging.getLogger(__name__)
+schema = '''
+CREATE TABLE IF NOT EXISTS reports (
+    idx INTEGER PRIMARY KEY,
+    payload TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+'''
+
+
+def connect(path: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(path)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.executescript(schema)
+    return connection
+
+
+def last(packet) -> int:
+    from client.network.serializable.packet import ReportBatch
+    if isinstance(packet, ReportBatch):
+        return max(x.index for x in packet.reports)
+    return packet.index
+
+
+def online() -> bool:
+    from client.network.websocket import Client
+    connection = Client().connection
+    return connection is not None and connection.online
+
+
+class OutboxThread(Thread):
+    def __init__(self, outbox: 'Outbox'):
+        super().__init__(daemon=True)
+        self.outbox: Outbox = outbox
+        self.queue: Queue[Tuple[int, str] | None] = Queue(maxsize=outbox.memory)
+        self.__connection: sqlite3.Connection | None = None
+        self.__resume: float = 0.0
+
+    def run(self):
+        logger.info('线程已启动')
+        self.__connection = sqlite3.connect(self.outbox.path)
+        pending = self.__connection.execute('SELECT COUNT(*) FROM reports').fetchone()[0]
+        self.outbox.restore(pending)
+        if pending > 0:
+            logger.info(f'发件箱中有 {pending} 条待补发的数据')
+        running = True
+        while running:
+            # 有积压且已在线时不阻塞等待, 以便持续补发; 补发受速率限制时等待至下一批次
+            timeout = max(0.0, min(1.0, self.__resume - time.monotonic())) if self.__ready() else 1.0
+            batch: List[Tuple[int, str]] = []
+            while len(batch) < self.outbox.batch_size:
+                try:
+                    item = self.queue.get(timeout=timeout) if len(batch) <= 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                batch.append(item)
+            if len(batch) > 0:
+                self.__store(batch)
+            if running and self.__ready() and time.monotonic() >= self.__resume:
+                try:
+                    self.__replay()
+                except Exception as ex:
+                    # 补发失败不能结束线程, 否则之后的数据都无法写入发件箱
+                    logger.error(f'补发数据时遇到问题: {ex}', exc_info=ex)
+                    self.__resume = time.monotonic() + 1.0
+            self.__checkpoint()
+        self.__connection.close()
+        self.__connection = None
+        logger.info('线程准备结束')
+
+    def __checkpoint(self):
+        acknowledged = self.outbox.checkpoint()
+        if acknowledged is None:
+            return
+        try:
+            with self.__connection:
+                self.__connection.execute("INSERT OR REPLACE INTO meta VALUES ('acknowledged', ?)", (acknowledged,))
+        except sqlite3.Error as ex:
+            logger.error(f'记录已送达的序号时遇到问题: {ex}', exc_info=ex)
+
+    def __ready(self) -> bool:
+        # 直接发送的数据尚未得到结果时不补发, 以免较新的数据先于可能失败的较早数据送达
+        return self.outbox.pending > 0 and self.outbox.settled and online()
+
+    def __store(self, batch: List[Tuple[int, str]]):
+        try:
+            with self.__connection:
+                self.__connection.executemany('INSERT OR REPLACE INTO reports VALUES (?, ?)', batch)
+                count = self.__connection.execute('SELECT COUNT(*) FROM reports').fetchone()[0]
+                excess = count - self.outbox.capacity
+                if excess > 0:
+                    self.__connection.execute('DELETE FROM reports WHERE idx IN '
+                                              '(SELECT idx FROM reports ORDER BY idx LIMIT ?)', (excess,))
+                    logger.warning(f'发件箱已满, 丢弃最早的 {excess} 条数据')
+                    self.outbox.release(excess)
+        except sqlite3.Error as ex:
+            logger.error(f'写入发件箱时遇到问题: {ex}', exc_info=ex)
+
+    def __replay(self):
+        from client.abstract.serialize import deserialize
+        from client.network.serializable.packet import ReportBatch
+        from client.network.websocket import Client
+        rows = self.__connection.execute('SELECT idx, payload FROM reports ORDER BY idx LIMIT ?',
+                                         (self.outbox.batch_size,)).fetchall()
+        if len(rows) <= 0:
+            # 计数与磁盘不一致时以磁盘为准, 仍在写入队列中的数据除外
+            self.outbox.release(self.outbox.pending - self.queue.qsize())
+            return
+        # 积压的数据重新打包为不超过 frame_size 条报告的 ReportBatch, 报告保留原有的序号
+        frames: List[Tuple[List[int], ReportBatch]] = []
+        indexes, reports, node = [], [], None
+        corrupted: List[Tuple[int]] = []
+        for index, payload in rows:
+            try:
+                packet = deserialize(payload)
+                if isinstance(packet, ReportBatch):
+                    node = node or packet.nodeId
+                    reports.extend(packet.reports)
+                else:
+                    node = node or packet.report.nodeId
+                    reports.append(packet)
+            except Exception as ex:
+                logger.error(f'发件箱中的数据 #{index} 无法解析, 已丢弃: {ex}')
+                corrupted.append((index,))
+                continue
+            indexes.append(index)
+            if len(reports) >= self.outbox.frame_size:
+                frames.append((indexes, ReportBatch(node, reports)))
+                indexes, reports, node = [], [], None
+        if len(reports) > 0:
+            frames.append((indexes, ReportBatch(node, reports)))
+        if len(corrupted) > 0:
+            with self.__connection:
+                self.__connection.executemany('DELETE FROM reports WHERE idx = ?', corrupted)
+            self.outbox.release(len(corrupted))
+        connection = Client().connection
+        # 逐个发送并等待结果, 遇到失败立即停止, 之后的数据留待下次补发, 确认的序号不会越过未送达的数据
+        delivered: List[Tuple[int]] = []
+        sent, failed = 0, False
+        for indexes, frame in frames:
+            try:
+                success = connection.send(frame).result(self.outbox.timeout)
+            except Exception as ex:
+                logger.warning(f'补发数据 #{indexes[0]} 时遇到问题: {ex}')
+                success = False
+            if not success:
+                failed = True
+                break
+            delivered.extend((x,) for x in indexes)
+            self.outbox.acknowledge(last(frame))
+            sent += len(frame.reports)
+        if len(delivered) > 0:
+            with self.__connection:
+                self.__connection.executemany('DELETE FROM reports WHERE idx = ?', delivered)
+            self.outbox.release(len(delivered))
+            logger.info(f'已补发 {len(delivered)} 条数据, 剩余 {self.outbox.pending} 条')
+        # 补发失败时稍后重试
+        self.__resume = time.monotonic() + (1.0 if failed else sent / self.outbox.rate)
+
+
+class Outbox(metaclass=Singleton):
+    def __init__(self, path: str = 'outbox.db', capacity: int = 100000, memory: int = 4096, batch_size: int = 256,
+                 frame_size: int = 64, rate: float = 512.0, timeout: float = 10.0, reserve: int = 1024):
+        # capacity 为磁盘上保留的最大条数, memory 为等待写入磁盘的最大条数
+        # frame_size 为补发时每个数据包包含的最大报告数量, rate 为每秒补发的最大报告数量
+        self.path: str = path
+        self.capacity: int = capacity
+        self.memory: int = memory
+        self.batch_size: int = batch_size
+        self.frame_size: int = frame_size
+        self.rate: float = rate
+        self.timeout: float = timeout
+        self.reserve: int = reserve
+        self.thread: OutboxThread | None = None
+        self.__lock: Lock = Lock()
+        self.__database: Lock = Lock()
+        self.__pending: int = 0
+        self.__index: int | None = None
+        self.__reserved: int = 0
+        # 最后一次确认写入连接的报告序号, 重连时告知服务端
+        self.__acknowledged: int | None = None
+        # 直接发送且尚未得到结果的数据包数量
+        self.__live: int = 0
+        self.__loaded: bool = False
+        self.__dirty: bool = False
+
+    @property
+    def pending(self) -> int:
+        return self.__pending
+
+    @property
+    def settled(self) -> bool:
+        return self.__live <= 0
+
+    @property
+    def acknowledged(self) -> int | None:
+        if not self.__loaded:
+            self.__load()
+        return self.__acknowledged
+
+    def __load(self):
+        with self.__database:
+            connection = connect(self.path)
+        try:
+            row = connection.execute("SELECT value FROM meta WHERE key = 'acknowledged'").fetchone()
+        finally:
+            connection.close()
+        with self.__lock:
+            if not self.__loaded:
+                if row is not None and (self.__acknowledged is None or row[0] > self.__acknowledged):
+                    self.__acknowledged = row[0]
+                self.__loaded = True
+
+    def acknowledge(self, index: int):
+        with self.__lock:
+            if self.__acknowledged is None or index > self.__acknowledged:
+                self.__acknowledged = index
+                self.__dirty = True
+
+    def checkpoint(self) -> int | None:
+        # 由发件箱线程定期持久化, 没有变化时返回 None
+        if not self.__loaded:
+            self.__load()
+        with self.__lock:
+            if not self.__dirty:
+                return None
+            self.__dirty = False
+            return self.__acknowledged
+
+    def launch(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        # 切换日志模式需要独占数据库, 在启动线程前完成
+        with self.__database:
+            connect(self.path).close()
+        self.thread = OutboxThread(self)
+        self.thread.start()
+
+    def stop(self, timeout: float | None = None):
+        if self.thread is None or not self.thread.is_alive():
+            return
+        self.thread.queue.put(None)
+        self.thread.join(timeout)
+
+    def restore(self, pending: int):
+        with self.__lock:
+            self.__pending += pending
+
+    def release(self, count: int):
+        with self.__lock:
+            self.__pending = max(0, self.__pending - count)
+
+    def next_index(self) -> int:
+        # 序号按块预留并持久化, 避免每个数据包都写入磁盘; 重启后从已预留的位置继续, 保证序号不回退
+        with self.__lock:
+            if self.__index is None or self.__index >= self.__reserved:
+                self.__reserve()
+            self.__index += 1
+            return self.__index
+
+    def __reserve(self):
+        with self.__database:
+            connection = connect(self.path)
+        try:
+            with connection:
+                row = connection.execute("SELECT value FROM meta WHERE key = 'index'").fetchone()
+                reserved = row[0] if row is not None else 0
+                if self.__index is None:
+                    self.__index = reserved
+                self.__reserved = reserved + self.reserve
+                connection.execute("INSERT OR REPLACE INTO meta VALUES ('index', ?)", (self.__reserved,))
+        finally:
+            connection.close()
+
+    def send(self, packet):
+        from client.network.serializable.packet import Report, ReportBatch
+        assert isinstance(packet, (Report, ReportBatch)), '发件箱只接受 Report 与 ReportBatch 数据包'
+        # 已有积压, 或之前直接发送的数据尚未得到结果时, 必须排在其后, 以保证送达顺序
+        with self.__lock:
+            live = self.__pending <= 0 and self.__live <= 0 and online()
+            if live:
+                self.__live += 1
+        if not live:
+            self.store(packet)
+            return
+        from client.network.websocket import Client
+        try:
+            future = Client().connection.send(packet)
+        except Exception as ex:
+            future = Future()
+            future.set_exception(ex)
+        future.add_done_callback(lambda x: self.__fallback(packet, x))
+
+    def store(self, packet):
+        from client.abstract.serialize import serialize
+        if self.thread is None or not self.thread.is_alive():
+            self.launch()
+        try:
+            self.thread.queue.put_nowait((packet.index, serialize(packet)))
+        except queue.Full:
+            logger.warning(f'发件箱写入队列已满, 丢弃数据 #{packet.index}')
+            return
+        with self.__lock:
+            self.__pending += 1
+
+    def __fallback(self, packet, future: Future[bool]):
+        try:
+            if future.cancelled() or future.exception() is not None or not future.result():
+                # 先计入积压再结束直接发送, 之后的数据不会越过这条数据
+                self.store(packet)
+                return
+            self.acknowledge(last(packet))
+        finally:
+            with self.__lock:
+                self.__live -= 1
@@ -0,0 +1,195 @@
+import logging
+import time
+from collections import deque
+from concurrent.futures import Future
+from enum import Enum
+from threading import Condition
+from typing import Callable, Deque, Dict, List, Tuple
+
+from client.network.metrics import Metrics, OutboundMetrics
+
+logger = logging.getLogger(__name__)
+
+
+class Backpressure(Enum):
+    # 队列已满时: 阻塞调用方 / 丢弃最早的数据 / 合并同一传感器尚未发送的报告
+    BLOCK = 0
+    DROP_OLDEST = 1
+    MERGE = 2
+
+
+class Priority(Enum):
+    # 数值越小越先发送: 会话控制 / 用户操作 / 传感器数据
+    CONTROL = 0
+    INTERACTIVE = 1
+    TELEMETRY = 2
+
+
+class Envelope:
+    def __init__(self, packet):
+        self.packet = packet
+        self.priority: Priority = getattr(packet, 'priority', Priority.INTERACTIVE)
+        self.futures: List[Future[bool]] = [Future()]
+        self.enqueued: float = time.monotonic()
+
+    @property
+    def future(self) -> Future[bool]:
+        return self.futures[0]
+
+    def resolve(self, result: bool):
+        for future in self.futures:
+            if not future.done():
+                future.set_result(result)
+
+
+class SendQueue:
+    def __init__(self, capacity: int = 1024, policy: Backpressure = Backpressure.MERGE, timeout: float = 10.0,
+                 share: float = 0.2, metrics: OutboundMetrics | None = None):
+        # timeout 为阻塞策略下调用方等待空位的最长时间, 超时后放弃本次发送
+        # share 为高优先级数据持续积压时传感器数据仍能获得的发送份额
+        self.capacity: int = capacity
+        self.policy: Backpressure = policy
+        self.timeout: float = timeout
+        self.share: float = share
+        self.metrics: OutboundMetrics = metrics if metrics is not None else Metrics().outbound
+        # 有新数据时在调用方线程中调用, 用于唤醒写入任务
+        self.notify: Callable[[], None] | None = None
+        self.closed: bool = False
+        self.__lanes: Dict[Priority, Deque[Envelope]] = {x: deque() for x in Priority}
+        self.__count: int = 0
+        self.__credit: float = 0.0
+        self.__condition: Condition = Condition()
+
+    def __len__(self) -> int:
+        return self.__count
+
+    def put(self, packet, block: bool = True) -> Future[bool]:
+        envelope = Envelope(packet)
+        dropped: List[Envelope] = []
+        with self.__condition:
+            if self.closed:
+                envelope.resolve(False)
+                return envelope.future
+            if self.__count >= self.capacity:
+                policy = self.policy
+                if policy == Backpressure.BLOCK and not block:
+                    # 写入线程自身不能等待自己腾出空位
+                    policy = Backpressure.DROP_OLDEST
+                if policy == Backpressure.BLOCK:
+                    self.metrics.blocked += 1
+                    if not self.__condition.wait_for(lambda: self.__count < self.capacity, self.timeout):
+                        self.metrics.dropped += 1
+                        logger.warning(f'发送队列已满, 放弃发送 {type(packet).__name__}')
+                        envelope.resolve(False)
+                        return envelope.future
+                elif policy != Backpressure.MERGE or not self.__merge(envelope):
+                    dropped.append(self.__drop())
+            self.__lanes[envelope.priority].append(envelope)
+            self.__count += 1
+            self.metrics.enqueue(self.__count)
+        for item in dropped:
+            logger.warning(f'发送队列已满, 丢弃最早的 {type(item.packet).__name__}')
+            item.resolve(False)
+        if self.notify is not None:
+            self.notify()
+        return envelope.future
+
+    def __drop(self) -> Envelope:
+        # 优先丢弃低优先级通道中最早的数据
+        for priority in reversed(Priority):
+            lane = self.__lanes[priority]
+            if len(lane) > 0:
+                self.__count -= 1
+                self.metrics.dropped += 1
+                return lane.popleft()
+        raise IndexError('发送队列为空')
+
+    def __merge(self, envelope: Envelope) -> bool:
+        from client.network.serializable.packet import Report
+        packet = envelope.packet
+        if not isinstance(packet, Report):
+            return False
+        lane = self.__lanes[envelope.priority]
+        for item in lane:
+            if isinstance(item.packet, Report) and item.packet.report.sensorId == packet.report.sensorId:
+                # 较新的数值覆盖旧值, 新报告中未上报的字段沿用旧值
+                packet.report.fields = {**item.packet.report.fields, **packet.report.fields}
+                # 记录被取代的序号, 保持序号连续
+                packet.merged = sorted({*(item.packet.merged or []), item.packet.index, *(packet.merged or [])})
+                envelope.futures.extend(item.futures)
+                envelope.enqueued = item.enqueued
+                lane.remove(item)
+                self.__count -= 1
+                self.metrics.merged += 1
+                return True
+        return False
+
+    def __next(self) -> Envelope:
+        telemetry = self.__lanes[Priority.TELEMETRY]
+        for priority in Priority:
+            lane = self.__lanes[priority]
+            if priority == Priority.TELEMETRY or len(lane) <= 0:
+                continue
+            if len(telemetry) > 0:
+                # 高优先级数据每发送一个, 积压的传感器数据累积一份额度, 额度满一个时插队发送
+                if self.__credit >= 1.0:
+                    break
+                self.__credit += self.share / (1.0 - self.share) if self.share < 1.0 else 1.0
+            return lane.popleft()
+        self.__credit = max(0.0, self.__credit - 1.0)
+        return telemetry.popleft()
+
+    def take(self, limit: int) -> List[Envelope]:
+        with self.__condition:
+            envelopes = [self.__next() for _ in range(min(limit, self.__count))]
+            self.__count -= len(envelopes)
+            self.metrics.depth = self.__count
+            self.__condition.notify_all()
+        now = time.monotonic()
+        for envelope in envelopes:
+            self.metrics.observe(envelope.priority.name.lower(), now - envelope.enqueued)
+        return envelopes
+
+    def close(self):
+        # 连接结束时未发送的数据以失败返回, 由调用方自行处理(例如写入发件箱)
+        with self.__condition:
+            self.closed = True
+        envelopes = self.take(len(self))
+        for envelope in envelopes:
+            envelope.resolve(False)
+
+
+def coalesce(envelopes: List[Envelope], frame_size: int) -> List[Tuple[object, List[Envelope]]]:
+    # 同时就绪且属于同一节点的连续报告合并为一个 ReportBatch, 减少写入次数; 其他数据包保持原有顺序单独发送
+    from client.network.serializable.packet import Report, ReportBatch
+    groups: List[Tuple[object, List[Envelope]]] = []
+    reports: List[Report] = []
+    members: List[Envelope] = []
+    node: str | None = None
+
+    def flush():
+        nonlocal reports, members, node
+        if len(members) == 1:
+            groups.append((members[0].packet, members))
+        elif len(members) > 1:
+            # 复制报告, 发送失败时调用方仍持有未修改的原始数据包
+            groups.append((ReportBatch(node, [Report(x.to_json()) for x in reports]), members))
+        reports, members, node = [], [], None
+
+    for envelope in envelopes:
+        packet = envelope.packet
+        if isinstance(packet, ReportBatch):
+            entries, owner = list(packet.reports), packet.nodeId
+        elif isinstance(packet, Report):
+            entries, owner = [packet], packet.report.nodeId
+        else:
+            flush()
+            groups.append((packet, [envelope]))
+            continue
+        if len(members) > 0 and (owner != node or len(reports) + len(entries) > frame_size):
+            flush()
+        node = owner
+        reports.extend(entries)
+        members.append(envelope)
+    flush()
+    return groups
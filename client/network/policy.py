@@ -0,0 +1,90 @@
+import logging
+from typing import Any, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+keys = ('deadband', 'percent', 'min_interval', 'max_interval')
+
+
+class FieldPolicy:
+    def __init__(self, deadband: float | None = None, percent: float | None = None,
+                 min_interval: float = 0.0, max_interval: float | None = None):
+        # deadband 为绝对变化量, percent 为相对上次上报值的百分比, 均未设置时每次读取都上报
+        self.deadband: float | None = deadband
+        self.percent: float | None = percent
+        self.min_interval: float = min_interval
+        self.max_interval: float | None = max_interval
+
+    @staticmethod
+    def load(values: Dict[str, Any]) -> 'FieldPolicy':
+        def optional(key: str) -> float | None:
+            return float(values[key]) if values.get(key, None) is not None else None
+
+        return FieldPolicy(optional('deadband'), optional('percent'),
+                           float(values.get('min_interval', 0.0)), optional('max_interval'))
+
+    def changed(self, previous: float, value: float) -> bool:
+        if self.deadband is None and self.percent is None:
+            return True
+        delta = abs(value - previous)
+        if self.deadband is not None and delta > self.deadband:
+            return True
+        return self.percent is not None and delta > abs(previous) * self.percent / 100
+
+    def due(self, elapsed: float, previous: float, value: float) -> bool:
+        if self.max_interval is not None and elapsed >= self.max_interval:
+            return True
+        return elapsed >= self.min_interval and self.changed(previous, value)
+
+
+class ReportPolicy:
+    def __init__(self, default: FieldPolicy, fields: Dict[str, FieldPolicy] | None = None,
+                 heartbeat: float | None = None):
+        # heartbeat 秒内没有任何字段上报时发送全部字段, 让服务端确认传感器仍然在线
+        self.default: FieldPolicy = default
+        self.fields: Dict[str, FieldPolicy] = fields if fields is not None else {}
+        self.heartbeat: float | None = heartbeat
+
+    @staticmethod
+    def load(*layers: Dict[str, Any]) -> 'ReportPolicy':
+        # 后面的配置覆盖前面的配置, 字段配置在传感器配置的基础上覆盖
+        settings: Dict[str, Any] = {}
+        fields: Dict[str, Dict[str, Any]] = {}
+        for layer in layers:
+            settings.update({x: y for x, y in layer.items() if x in keys or x == 'heartbeat'})
+            for key, values in (layer.get('fields', None) or {}).items():
+                fields.setdefault(key, {}).update(values or {})
+        base = {x: y for x, y in settings.items() if x in keys}
+        heartbeat = settings.get('heartbeat', None)
+        return ReportPolicy(FieldPolicy.load(base), {x: FieldPolicy.load({**base, **y}) for x, y in fields.items()},
+                            float(heartbeat) if heartbeat is not None else None)
+
+    def field(self, key: str) -> FieldPolicy:
+        return self.fields.get(key, self.default)
+
+
+class Reporter:
+    def __init__(self, policy: ReportPolicy):
+        self.policy: ReportPolicy = policy
+        self.__reported: Dict[str, Tuple[float, float]] = {}
+        self.__heartbeat: float | None = None
+
+    def filter(self, fields: Dict[str, float], now: float) -> Dict[str, float]:
+        # 返回本次需要上报的字段, 并记录为已上报; now 为单调时钟
+        heartbeat = self.policy.heartbeat
+        if heartbeat is not None and (self.__heartbeat is None or now - self.__heartbeat >= heartbeat):
+            selected = dict(fields)
+        else:
+            selected = {}
+            for key, value in fields.items():
+                reported = self.__reported.get(key, None)
+                if reported is None or self.policy.field(key).due(now - reported[0], reported[1], value):
+                    selected[key] = value
+        for key, value in selected.items():
+            self.__reported[key] = (now, value)
+        if len(selected) > 0:
+            self.__heartbeat = now
+        return selected
+
+    def reset(self):
+        self.__reported.clear()
+        self.__heartbeat = None
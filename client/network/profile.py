@@ -0,0 +1,308 @@
+import logging
+import os
+import struct
+from operator import itemgetter
+from struct import Struct
+from typing import Any, Dict, FrozenSet, Iterable, List, Tuple
+
+import yaml
+
+from client.abstract.meta import Singleton
+from client.network.policy import FieldPolicy, ReportPolicy
+
+try:
+    from yaml import CLoader as Loader
+except ImportError:
+    from yaml import Loader
+
+logger = logging.getLogger(__name__)
+# 类型名称: (struct 格式字符, 占用寄存器数量)
+types: Dict[str, Tuple[str, int]] = {
+    'int16': ('h', 1),
+    'uint16': ('H', 1),
+    'int32': ('i', 2),
+    'uint32': ('I', 2),
+    'float32': ('f', 2),
+    'float64': ('d', 4)
+}
+orders = {
+    'big': '>',
+    'little': '<'
+}
+# 单次读取寄存器数量上限
+limit = 125
+
+
+class FieldMapping:
+    def __init__(self, key: str, register: int, scale: float = 1.0, offset: float = 0.0):
+        self.key: str = key
+        self.register: int = register
+        self.scale: float = scale
+        self.offset: float = offset
+
+
+class Block:
+    def __init__(self, address: int, count: int, kind: str, function: int, word_order: str, byte_order: str):
+        if kind not in types:
+            raise ValueError(f'未知的数据类型: {kind}')
+        if word_order not in orders or byte_order not in orders:
+            raise ValueError(f'未知的字节序: {word_order}/{byte_order}')
+        self.address: int = address
+        self.count: int = count
+        self.kind: str = kind
+        self.function: int = function
+        self.char, self.width = types[kind]
+        if count % self.width != 0:
+            raise ValueError(f'寄存器数量 {count} 无法按 {kind} 解析')
+        # 单寄存器类型不存在字序问题
+        if self.width == 1:
+            word_order = byte_order
+        # 按寄存器打包时使用的字节序与字序无关, 解析时统一使用字序即可还原数值
+        self.packing: str = '>' if word_order == byte_order else '<'
+        self.order: str = orders[word_order]
+
+    @property
+    def length(self) -> int:
+        return self.count // self.width
+
+    def covers(self, register: int) -> bool:
+        return self.address <= register < self.address + self.count and (register - self.address) % self.width == 0
+
+    def slot(self, register: int) -> int:
+        return (register - self.address) // self.width
+
+
+class Segment:
+    def __init__(self, index: int, block: Block, slots: List[int]):
+        self.index: int = index
+        self.block: Block = block
+        self.slots: List[int] = slots
+        self.first: int = slots[0]
+        self.address: int = block.address + slots[0] * block.width
+        self.count: int = (slots[-1] - slots[0] + 1) * block.width
+        self.packer: Struct = Struct(f'{block.packing}{self.count}H')
+        # 未使用的数值以填充字节跳过, 解析时只生成需要的数值
+        needed = set(slots)
+        layout = ''.join(block.char if slot in needed else f'{block.width * 2}x'
+                         for slot in range(slots[0], slots[-1] + 1))
+        self.unpacker: Struct = Struct(f'{block.order}{layout}')
+
+    def decode_into(self, buffer: bytearray, offset: int, registers: List[int]) -> Tuple[float, ...]:
+        # 寄存器直接写入预分配的缓冲区后整体按目标类型重新解释, 不产生中间 bytes 对象
+        self.packer.pack_into(buffer, offset, *registers)
+        return self.unpacker.unpack_from(buffer, offset)
+
+
+class Read:
+    def __init__(self, function: int, address: int, count: int):
+        self.function: int = function
+        self.address: int = address
+        self.count: int = count
+        # 区段及其在本次读取结果中的寄存器偏移
+        self.segments: List[Tuple[Segment, int]] = []
+
+    def include(self, segment: Segment):
+        self.segments.append((segment, segment.address - self.address))
+        self.count = max(self.count, segment.address + segment.count - self.address)
+
+
+class Decoder:
+    def __init__(self, reads: List[Read], keys: List[str], slots: Dict[str, Tuple[int, int, float, float]],
+                 mask: FrozenSet[str] | None = None):
+        self.reads: List[Read] = reads
+        self.keys: List[str] = keys
+        # 字段在结果中的位置: (区块序号, 区块内序号, 倍率, 偏移), 未映射或未启用的字段为 None
+        self.slots: List[Tuple[int, int, float, float] | None] = [
+            slots.get(key, None) if mask is None or key in mask else None for key in keys]
+
+        positions: Dict[Tuple[int, int], int] = {}
+        self.offsets: List[List[int]] = []
+        cursor, start = 0, 0
+        for read in reads:
+            offsets = []
+            for segment, _ in read.segments:
+                offsets.append(cursor)
+                cursor += segment.count * 2
+                for slot in segment.slots:
+                    positions[(segment.index, slot)] = start
+                    start += 1
+            self.offsets.append(offsets)
+        self.buffer: bytearray = bytearray(cursor)
+        self.single: bool = len(reads) == 1 and len(reads[0].segments) == 1
+        # 所有区段解析结果依次拼接, 末尾追加一个 None 供未映射或未启用的字段使用, 这些字段不参与换算也不会上报
+        indexes = [positions.get((slot[0], slot[1]), start) if slot is not None else start for slot in self.slots]
+        self.identity: bool = indexes == list(range(len(indexes))) and len(indexes) <= start
+        self.picker = itemgetter(*indexes) if len(indexes) > 0 else None
+        self.scales: List[Tuple[int, float, float]] = [(position, slot[2], slot[3])
+                                                       for position, slot in enumerate(self.slots)
+                                                       if slot is not None and (slot[2] != 1.0 or slot[3] != 0.0)]
+
+    def decode(self, payloads: List[List[int]]) -> List[float | None]:
+        if self.single:
+            segment, offset = self.reads[0].segments[0]
+            registers = payloads[0]
+            if offset != 0 or segment.count != len(registers):
+                registers = registers[offset:offset + segment.count]
+            decoded = segment.decode_into(self.buffer, 0, registers)
+        else:
+            decoded = ()
+            for read, offsets, registers in zip(self.reads, self.offsets, payloads):
+                for (segment, offset), cursor in zip(read.segments, offsets):
+                    decoded += segment.decode_into(self.buffer, cursor, registers[offset:offset + segment.count])
+        if self.identity:
+            values = list(decoded[:len(self.slots)]) if len(self.slots) < len(decoded) else list(decoded)
+        elif self.picker is None:
+            return []
+        else:
+            picked = self.picker(decoded + (None,))
+            values = list(picked) if len(self.slots) > 1 else [picked]
+        for position, scale, offset in self.scales:
+            values[position] = values[position] * scale + offset
+        return values
+
+
+class DeviceProfile:
+    def __init__(self, model: str, slave: int, blocks: List[Block], fields: List[FieldMapping] | None,
+                 interval: float = 10.0, jitter: float = 0.0, gap: int | None = None):
+        self.model: str = model
+        self.slave: int = slave
+        self.interval: float = interval
+        self.jitter: float = jitter
+        self.gap: int | None = gap
+        self.blocks: List[Block] = blocks
+        self.fields: List[FieldMapping] | None = fields
+        self.__decoders: Dict[Tuple[Tuple[str, ...], FrozenSet[str] | None, int], Decoder] = {}
+
+    @staticmethod
+    def load(model: str, values: Dict[str, Any]) -> 'DeviceProfile':
+        function = int(values.get('function', 3))
+        word_order = values.get('word_order', 'big')
+        byte_order = values.get('byte_order', 'big')
+        kind = values.get('type', 'float32')
+        blocks = []
+        for block in values.get('blocks', []):
+            blocks.append(Block(int(block['address']), int(block['count']), block.get('type', kind),
+                                int(block.get('function', function)),
+                                block.get('word_order', word_order), block.get('byte_order', byte_order)))
+        if len(blocks) <= 0:
+            raise ValueError(f'设备 {model} 未定义任何寄存器区块')
+        fields = None
+        if 'fields' in values:
+            fields = []
+            for key, field in values['fields'].items():
+                if not isinstance(field, dict):
+                    field = {'register': field}
+                fields.append(FieldMapping(key, int(field['register']),
+                                           float(field.get('scale', 1.0)), float(field.get('offset', 0.0))))
+        return DeviceProfile(model, int(values.get('slave', 1)), blocks, fields,
+                             float(values.get('interval', 10.0)), float(values.get('jitter', 0.0)),
+                             int(values['gap']) if 'gap' in values else None)
+
+    def decoder(self, keys: List[str], enabled: Iterable[str] | None = None, gap: int = 0) -> Decoder:
+        if self.gap is not None:
+            gap = self.gap
+        mask = frozenset(enabled) if enabled is not None else None
+        identifier = (tuple(keys), mask, gap)
+        decoder = self.__decoders.get(identifier, None)
+        if decoder is None:
+            slots = self.__slots(keys)
+            needed = [slots[key] for key in keys if key in slots and (mask is None or key in mask)]
+            decoder = Decoder(self.__plan(needed, gap), keys, slots, mask)
+            self.__decoders[identifier] = decoder
+            logger.info(f'设备 {self.model} 读取计划: '
+                        f'{", ".join(f"{x.address}+{x.count}" for x in decoder.reads) or "无"}')
+        return decoder
+
+    def __plan(self, needed: List[Tuple[int, int, float, float]], gap: int) -> List[Read]:
+        # 按区块拆分出需要读取的区段, 区段内间隔超过 gap 个寄存器时拆分为两个区段
+        segments: List[Segment] = []
+        for index, block in enumerate(self.blocks):
+            slots = sorted({slot for block_index, slot, *_ in needed if block_index == index})
+            run: List[int] = []
+            for slot in slots:
+                if len(run) > 0 and ((slot - run[-1] - 1) * block.width > gap or
+                                     (slot - run[0] + 1) * block.width > limit):
+                    segments.append(Segment(index, block, run))
+                    run = []
+                run.append(slot)
+            if len(run) > 0:
+                segments.append(Segment(index, block, run))
+        # 相同功能码的相邻区段在间隔不超过 gap 时合并为一次读取, 多读的寄存器比额外的请求更省时
+        segments.sort(key=lambda x: (x.block.function, x.address))
+        reads: List[Read] = []
+        for segment in segments:
+            read = reads[-1] if len(reads) > 0 else None
+            if (read is None or read.function != segment.block.function or
+                    segment.address - (read.address + read.count) > gap or
+                    segment.address + segment.count - read.address > limit):
+                read = Read(segment.block.function, segment.address, segment.count)
+                reads.append(read)
+            read.include(segment)
+        return reads
+
+    def __slots(self, keys: List[str]) -> Dict[str, Tuple[int, int, float, float]]:
+        slots = {}
+        if self.fields is None:
+            # 未声明字段映射时按照结构中字段的顺序依次对应区块中的数值
+            cursor = 0
+            for index, block in enumerate(self.blocks):
+                for slot in range(block.length):
+                    if cursor >= len(keys):
+                        return slots
+                    slots[keys[cursor]] = (index, slot, 1.0, 0.0)
+                    cursor += 1
+            return slots
+        for field in self.fields:
+            for index, block in enumerate(self.blocks):
+                if block.covers(field.register):
+                    slots[field.key] = (index, block.slot(field.register), field.scale, field.offset)
+                    break
+            else:
+                logger.warning(f'设备 {self.model} 的字段 {field.key} 不在任何寄存器区块内')
+        return slots
+
+
+class Profiles(metaclass=Singleton):
+    def __init__(self, path: str = 'devices.yml'):
+        self.path: str = path
+        self.profiles: Dict[str, DeviceProfile] = {}
+        self.sensors: Dict[str, Dict[str, Any]] = {}
+        self.ports: Dict[str, Dict[str, Any]] = {}
+        self.reports: Dict[str, Dict[str, Any]] = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            logger.warning(f'未找到设备配置文件 {self.path}')
+            return
+        with open(self.path, 'r') as file:
+            values = yaml.load(file, Loader) or {}
+        profiles = {}
+        for model, profile in values.get('profiles', {}).items():
+            try:
+                profiles[model] = DeviceProfile.load(model, profile)
+            except (KeyError, ValueError, TypeError, struct.error) as ex:
+                logger.error(f'加载设备配置 {model} 时遇到问题: {ex}', exc_info=ex)
+        self.profiles = profiles
+        self.sensors = values.get('sensors', None) or {}
+        self.ports = values.get('ports', None) or {}
+        self.reports = values.get('report', None) or {}
+        logger.info(f'已加载 {len(profiles)} 个设备配置')
+
+    def get(self, model: str) -> DeviceProfile | None:
+        return self.profiles.get(model, None)
+
+    def port(self, port: str) -> Dict[str, Any]:
+        return self.ports.get(port, None) or {}
+
+    def report(self, name: str, model: str) -> ReportPolicy:
+        layers = [self.reports.get(x, None) or {} for x in ('default', model, name)]
+        try:
+            return ReportPolicy.load(*layers)
+        except (TypeError, ValueError, AttributeError) as ex:
+            logger.error(f'加载传感器 {name} 的上报策略时遇到问题: {ex}', exc_info=ex)
+            return ReportPolicy(FieldPolicy())
+
+    def interval(self, name: str, profile: DeviceProfile) -> Tuple[float, float]:
+        settings = self.sensors.get(name, None) or {}
+        return float(settings.get('interval', profile.interval)), float(settings.get('jitter', profile.jitter))
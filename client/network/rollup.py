@@ -0,0 +1,117 @@
+import time
+from threading import Lock
+from typing import Dict, List, Tuple
+
+import numpy
+from numpy import ndarray
+
+# 聚合粒度(秒): 保留的桶数量, 依次为 1 天, 7 天, 30 天, 1 年
+tiers: Dict[int, int] = {
+    60: 1440,
+    600: 1008,
+    3600: 720,
+    86400: 366
+}
+
+
+def offset() -> int:
+    # 按本地时间对齐, 使日级聚合以本地零点为界
+    return time.localtime().tm_gmtoff
+
+
+class Tier:
+    def __init__(self, width: int, capacity: int):
+        self.width: int = width
+        self.capacity: int = capacity
+        self.offset: int = offset()
+        # 每个桶同时写入 index 与 index + capacity 两处, 任意不超过容量的最近窗口在内存中都是连续的
+        self.__starts: ndarray = numpy.zeros(capacity * 2, dtype=numpy.int64)
+        self.__minimum: ndarray = numpy.zeros(capacity * 2, dtype=numpy.float64)
+        self.__maximum: ndarray = numpy.zeros(capacity * 2, dtype=numpy.float64)
+        self.__total: ndarray = numpy.zeros(capacity * 2, dtype=numpy.float64)
+        self.__count: ndarray = numpy.zeros(capacity * 2, dtype=numpy.int64)
+        self.__head: int = 0
+        self.__size: int = 0
+
+    def __len__(self) -> int:
+        return self.__size
+
+    @property
+    def span(self) -> int:
+        return self.width * self.capacity
+
+    def bucket(self, timestamp: int) -> int:
+        return timestamp - (timestamp + self.offset) % self.width
+
+    def add(self, timestamp: int, value: float):
+        self.merge(self.bucket(timestamp), value, value, value, 1)
+
+    def merge(self, start: int, minimum: float, maximum: float, total: float, count: int):
+        index = self.__find(start)
+        if index is None:
+            if self.__size > 0 and start < int(self.__starts[self.__head - 1 + self.capacity]):
+                # 样本按时间顺序到达, 早于最新桶且没有对应桶的样本只在时钟回拨时出现, 直接丢弃
+                return
+            index = self.__head
+            self.__head = (index + 1) % self.capacity
+            if self.__size < self.capacity:
+                self.__size += 1
+            for position in (index, index + self.capacity):
+                self.__starts[position] = start
+                self.__minimum[position] = minimum
+                self.__maximum[position] = maximum
+                self.__total[position] = total
+                self.__count[position] = count
+            return
+        for position in (index, index + self.capacity):
+            self.__minimum[position] = min(self.__minimum[position], minimum)
+            self.__maximum[position] = max(self.__maximum[position], maximum)
+            self.__total[position] += total
+            self.__count[position] += count
+
+    def __find(self, start: int) -> int | None:
+        if self.__size <= 0:
+            return None
+        latest = self.__head - 1 + self.capacity
+        if self.__starts[latest] == start:
+            return latest % self.capacity
+        starts, _, _, _, _ = self.window()
+        position = int(numpy.searchsorted(starts, start))
+        if position < len(starts) and starts[position] == start:
+            return (self.__head - self.__size + position) % self.capacity
+        return None
+
+    def window(self, start: int | None = None,
+               end: int | None = None) -> Tuple[ndarray, ndarray, ndarray, ndarray, ndarray]:
+        # 返回 [start, end) 内的桶: 起始时间, 最小值, 最大值, 总和, 数量; 均为只读视图
+        stop = self.__head + self.capacity
+        first = stop - self.__size
+        views = [x[first:stop] for x in (self.__starts, self.__minimum, self.__maximum, self.__total, self.__count)]
+        if start is not None or end is not None:
+            starts = views[0]
+            left = 0 if start is None else int(numpy.searchsorted(starts, self.bucket(start), side='left'))
+            right = len(starts) if end is None else int(numpy.searchsorted(starts, end, side='left'))
+            views = [x[left:right] for x in views]
+        for view in views:
+            view.flags.writeable = False
+        return views[0], views[1], views[2], views[3], views[4]
+
+
+class Rollup:
+    def __init__(self):
+        self.tiers: List[Tier] = [Tier(width, capacity) for width, capacity in tiers.items()]
+        # 写入在监控线程中进行, 其他线程读取时持有锁并只复制所需的窗口
+        self.lock: Lock = Lock()
+
+    def add(self, timestamp: int, value: float):
+        with self.lock:
+            for tier in self.tiers:
+                tier.add(timestamp, value)
+
+    def tier(self, step: int) -> Tier | None:
+        # 选择能整除 step 的最粗一级, 保证每个桶完整落入一个步长; 没有时返回 None 表示使用原始数据
+        selected = None
+        for tier in self.tiers:
+            if step % tier.width == 0:
+                selected = tier
+        return selected
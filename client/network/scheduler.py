@@ -0,0 +1,96 @@
+import heapq
+import logging
+import random
+import time
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Schedule:
+    def __init__(self, key: str, interval: float, jitter: float, deadline: float):
+        self.key: str = key
+        self.interval: float = interval
+        self.jitter: float = jitter
+        # 不含抖动的基准时间, 下次截止时间均由此推算以避免累积漂移
+        self.anchor: float = deadline
+        self.deadline: float = deadline
+        self.running: bool = False
+        self.skipped: int = 0
+
+
+class Scheduler:
+    def __init__(self):
+        self.__queue: List[Tuple[float, int, str]] = []
+        self.__schedules: Dict[str, Schedule] = {}
+        self.__sequence: int = 0
+
+    def __len__(self) -> int:
+        return len(self.__schedules)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.__schedules
+
+    def get(self, key: str) -> Schedule | None:
+        return self.__schedules.get(key, None)
+
+    def add(self, key: str, interval: float, jitter: float = 0.0, delay: float = 0.0):
+        if interval <= 0:
+            raise ValueError(f'轮询间隔必须大于 0: {interval}')
+        schedule = Schedule(key, interval, min(jitter, interval / 2), time.monotonic() + delay)
+        self.__schedules[key] = schedule
+        self.__push(schedule)
+
+    def remove(self, key: str):
+        # 队列中的过期条目会在弹出时被忽略
+        self.__schedules.pop(key, None)
+
+    def delay(self) -> float | None:
+        self.__prune()
+        if len(self.__queue) <= 0:
+            return None
+        return max(0.0, self.__queue[0][0] - time.monotonic())
+
+    def due(self) -> List[str]:
+        now = time.monotonic()
+        keys = []
+        while len(self.__queue) > 0 and self.__queue[0][0] <= now:
+            deadline, _, key = heapq.heappop(self.__queue)
+            schedule = self.__schedules.get(key, None)
+            if schedule is None or schedule.deadline != deadline or schedule.running:
+                continue
+            schedule.running = True
+            keys.append(key)
+        return keys
+
+    def done(self, key: str):
+        schedule = self.__schedules.get(key, None)
+        if schedule is None:
+            return
+        schedule.running = False
+        now = time.monotonic()
+        anchor = schedule.anchor + schedule.interval
+        if anchor <= now:
+            # 本次轮询超出了下一周期, 跳过错过的周期并对齐到之后最近的周期, 不进行补偿轮询
+            missed = int((now - anchor) // schedule.interval) + 1
+            schedule.skipped += missed
+            anchor += missed * schedule.interval
+            logger.warning(f'设备 {key} 轮询超时, 跳过 {missed} 个周期')
+        schedule.anchor = anchor
+        deadline = anchor
+        if schedule.jitter > 0:
+            deadline += random.uniform(-schedule.jitter, schedule.jitter)
+        schedule.deadline = max(now, deadline)
+        self.__push(schedule)
+
+    def __push(self, schedule: Schedule):
+        self.__sequence += 1
+        heapq.heappush(self.__queue, (schedule.deadline, self.__sequence, schedule.key))
+
+    def __prune(self):
+        while len(self.__queue) > 0:
+            deadline, _, key = self.__queue[0]
+            schedule = self.__schedules.get(key, None)
+            if schedule is not None and schedule.deadline == deadline and not schedule.running:
+                return
+            heapq.heappop(self.__queue)
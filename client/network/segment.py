@@ -0,0 +1,146 @@
+import logging
+import os
+from threading import Lock
+from typing import Dict, Tuple
+
+import numpy
+from numpy import ndarray
+
+logger = logging.getLogger(__name__)
+
+
+class Segment:
+    def __init__(self, directory: str, sensor: str, field: str):
+        # 每个序列两个只追加的列文件, .ts 为 int64 时间戳, .val 为 float64 数值, 均为本机字节序并按时间升序排列
+        self.path: str = os.path.join(directory, sensor, field)
+        self.__timestamps: ndarray = numpy.zeros(0, dtype=numpy.int64)
+        self.__values: ndarray = numpy.zeros(0, dtype=numpy.float64)
+        self.__lock: Lock = Lock()
+
+    @property
+    def timestamps_path(self) -> str:
+        return self.path + '.ts'
+
+    @property
+    def values_path(self) -> str:
+        return self.path + '.val'
+
+    def __len__(self) -> int:
+        if not os.path.exists(self.timestamps_path) or not os.path.exists(self.values_path):
+            return 0
+        # 先写数值后写时间戳, 异常中断时以较短的一列为准
+        return min(os.path.getsize(self.timestamps_path), os.path.getsize(self.values_path)) // 8
+
+    def view(self) -> Tuple[ndarray, ndarray]:
+        # 文件长度变化时重新映射, 返回的数组直接引用页缓存, 不占用额外内存
+        with self.__lock:
+            return self.__view()
+
+    def __view(self) -> Tuple[ndarray, ndarray]:
+        count = len(self)
+        if count != len(self.__timestamps):
+            if count <= 0:
+                self.__timestamps = numpy.zeros(0, dtype=numpy.int64)
+                self.__values = numpy.zeros(0, dtype=numpy.float64)
+            else:
+                self.__timestamps = numpy.memmap(self.timestamps_path, dtype=numpy.int64, mode='r', shape=(count,))
+                self.__values = numpy.memmap(self.values_path, dtype=numpy.float64, mode='r', shape=(count,))
+        return self.__timestamps, self.__values
+
+    def range(self, start: int, end: int) -> Tuple[ndarray, ndarray]:
+        timestamps, values = self.view()
+        left = int(numpy.searchsorted(timestamps, start, side='left'))
+        right = int(numpy.searchsorted(timestamps, end, side='left'))
+        return timestamps[left:right], values[left:right]
+
+    def last(self) -> int | None:
+        timestamps, _ = self.view()
+        return int(timestamps[-1]) if len(timestamps) > 0 else None
+
+    def append(self, timestamps: ndarray, values: ndarray):
+        # 与 view 和 trim 共用锁, 读取方不会看到只写入了一列的数据
+        with self.__lock:
+            existing, _ = self.__view()
+            if len(existing) > 0:
+                mask = timestamps > int(existing[-1])
+                timestamps, values = timestamps[mask], values[mask]
+            if len(timestamps) <= 0:
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            count = len(self)
+            # 截去异常中断时多写入的部分, 保证两列长度一致
+            for path in (self.values_path, self.timestamps_path):
+                if os.path.exists(path) and os.path.getsize(path) != count * 8:
+                    os.truncate(path, count * 8)
+            with open(self.values_path, 'ab') as file:
+                file.write(numpy.ascontiguousarray(values, dtype=numpy.float64).tobytes())
+            with open(self.timestamps_path, 'ab') as file:
+                file.write(numpy.ascontiguousarray(timestamps, dtype=numpy.int64).tobytes())
+
+    def trim(self, before: int):
+        # 两列文件在锁内依次替换, 读取方不会映射到一新一旧、长度不一致的两列
+        with self.__lock:
+            timestamps, values = self.__view()
+            start = int(numpy.searchsorted(timestamps, before, side='left'))
+            if start <= 0:
+                return
+            # 写入临时文件后替换, 已映射的旧文件在读取方释放前仍然有效
+            for path, column in ((self.values_path, values[start:]), (self.timestamps_path, timestamps[start:])):
+                with open(path + '.tmp', 'wb') as file:
+                    file.write(column.tobytes())
+                os.replace(path + '.tmp', path)
+            self.__timestamps = numpy.zeros(0, dtype=numpy.int64)
+            self.__values = numpy.zeros(0, dtype=numpy.float64)
+
+
+class Segments:
+    def __init__(self, directory: str):
+        self.directory: str = directory
+        self.__segments: Dict[Tuple[str, str], Segment] = {}
+        self.__lock: Lock = Lock()
+
+    @property
+    def marker(self) -> str:
+        return os.path.join(self.directory, 'sealed')
+
+    @property
+    def sealed(self) -> str | None:
+        # 最后一个已转换为列文件的分区
+        if not os.path.exists(self.marker):
+            return None
+        with open(self.marker, 'r') as file:
+            return file.read().strip() or None
+
+    @sealed.setter
+    def sealed(self, name: str):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.marker + '.tmp', 'w') as file:
+            file.write(name)
+        os.replace(self.marker + '.tmp', self.marker)
+
+    def get(self, sensor: str, field: str) -> Segment:
+        key = (sensor, field)
+        segment = self.__segments.get(key, None)
+        if segment is None:
+            with self.__lock:
+                segment = self.__segments.setdefault(key, Segment(self.directory, sensor, field))
+        return segment
+
+    def all(self) -> Dict[Tuple[str, str], Segment]:
+        if os.path.isdir(self.directory):
+            for sensor in os.listdir(self.directory):
+                path = os.path.join(self.directory, sensor)
+                if not os.path.isdir(path):
+                    continue
+                for name in os.listdir(path):
+                    if name.endswith('.ts'):
+                        self.get(sensor, name[:-3])
+        with self.__lock:
+            return dict(self.__segments)
+
+    def trim(self, before: int):
+        for segment in self.all().values():
+            try:
+                segment.trim(before)
+            except OSError as ex:
+                logger.warning(f'裁剪历史数据列文件 {segment.path} 时遇到问题: {ex}')
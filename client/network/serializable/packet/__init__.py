@@ -2,4 +2,5 @@ from .auth import RequestNodeRegistration, NodeRegistration, RequestProfile, Pro
 from .control import Failure, Operation
 from .node import RequestNodeList, NodeList, NodeCreation
 from .pond import PondList, PondCreation, PondCreationReceipt
-from .sensor import RequestSensorTypeList, SensorTypeList, SensorCreation, SensorCreationReceipt, Report
+from .sensor import RequestSensorTypeList, SensorTypeList, SensorCreation, SensorCreationReceipt, Report, \
+    ReportBatch, SensorHandles, CompactReports
@@ -6,6 +6,7 @@ from jsonobject import StringProperty, ObjectProperty, ListProperty, DictPropert
 
 from client.abstract.packet import IncomingPacket, OutgoingPacket
 from client.abstract.serialize import serializable
+from client.network.outgoing import Priority
 from client.config.cached import Cached
 from client.config.secrets import Secrets
 from client.network.serializable import Pond, Node, Sensor, SensorStructure
@@ -23,6 +24,7 @@ class RequestNodeRegistration(IncomingPacket):
 
 @serializable
 class NodeRegistration(OutgoingPacket):
+    priority = Priority.CONTROL
     signature = StringProperty()
 
     def __init__(self, signature: str):
@@ -31,6 +33,7 @@ class NodeRegistration(OutgoingPacket):
 
 @serializable
 class RequestProfile(OutgoingPacket):
+    priority = Priority.CONTROL
     nodeId = StringProperty()
     signature = StringProperty()
 
@@ -68,5 +71,6 @@ class Profile(IncomingPacket):
                 continue
             future = monitors.thread.monitor(sensor, structure)
             futures.append(asyncio.wrap_future(future, loop=loop))
+        connection.announce(self.node.id, self.sensors, self.structures)
         asyncio.gather(*futures).add_done_callback(to_dashboard)
         # to_dashboard(None)
@@ -1,10 +1,12 @@
 import logging
+from typing import List
 
-from jsonobject import StringProperty, ObjectProperty, SetProperty, IntegerProperty
+from jsonobject import StringProperty, ObjectProperty, SetProperty, IntegerProperty, ListProperty
 
 from client.abstract.packet import IncomingPacket, OutgoingPacket
 from client.abstract.serialize import serializable
 from client.config.cached import Cached
+from client.network.outgoing import Priority
 from client.network.serializable import Sensor, SensorStructure, SensorReport
 from client.network.websocket import Connection, Client
 from client.ui.window import MainWindow
@@ -52,22 +54,69 @@ class SensorCreationReceipt(IncomingPacket):
         profile.sensors.append(self.sensor)
         if self.structure is not None:
             profile.structures[self.structure.type] = self.structure
+        connection.announce(profile.node.id, profile.sensors, profile.structures)
         window.builder.emit([DashboardPage, window])
 
 
-count = 0
+@serializable
+class Report(OutgoingPacket):
+    priority = Priority.TELEMETRY
+    index = IntegerProperty()
+    report = ObjectProperty(SensorReport)
+    # 发送队列合并时被本报告取代的较早序号, 服务端据此区分被合并的序号与丢失的序号
+    merged = ListProperty(int, default=None, exclude_if_none=True)
 
+    def __init__(self, report: SensorReport | dict):
+        if isinstance(report, dict):
+            # 从发件箱恢复时保留原有的序号
+            super().__init__(report)
+            return
+        from client.network.outbox import Outbox
+        super().__init__(index=Outbox().next_index(), report=report)
+
+
+@serializable
+class ReportBatch(OutgoingPacket):
+    priority = Priority.TELEMETRY
+    nodeId = StringProperty()
+    reports = ListProperty(Report)
+
+    def __init__(self, node_id: str | dict, reports: List[Report] | None = None):
+        if isinstance(node_id, dict):
+            super().__init__(node_id)
+            return
+        for report in reports:
+            report.report.nodeId = None
+        super().__init__(nodeId=node_id, reports=reports)
 
-def _report_index() -> int:
-    global count
-    count = count + 1
-    return count
+    @property
+    def index(self) -> int:
+        return self.reports[0].index
 
 
 @serializable
-class Report(OutgoingPacket):
-    index = IntegerProperty()
-    report = ObjectProperty(SensorReport)
+class SensorHandles(OutgoingPacket):
+    # 第 i 个传感器的句柄为 i, 只在当前连接内有效
+    priority = Priority.CONTROL
+    nodeId = StringProperty()
+    sensors = ListProperty(str)
+
+    def __init__(self, node_id: str | dict, sensors: List[str] | None = None):
+        if isinstance(node_id, dict):
+            super().__init__(node_id)
+            return
+        super().__init__(nodeId=node_id, sensors=sensors)
+
 
-    def __init__(self, report: SensorReport):
-        super().__init__(index=_report_index(), report=report)
+@serializable
+class CompactReports(OutgoingPacket):
+    # 每行为 [序号, 句柄, 毫秒时间戳, 字段掩码, 数值...], 数值按传感器结构中的字段顺序排列, 只包含掩码中的字段
+    priority = Priority.TELEMETRY
+    nodeId = StringProperty()
+    rows = ListProperty()
+
+    def __init__(self, node_id: str | dict, rows: List[list] | None = None):
+        if isinstance(node_id, dict):
+            super().__init__(node_id)
+            return
+        super().__init__(nodeId=node_id, rows=rows)
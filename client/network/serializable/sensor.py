@@ -28,11 +28,17 @@ class SensorStructure(JsonObject):
 
 
 class SensorReport(JsonObject):
-    nodeId = StringProperty()
+    # 批量上报时由 ReportBatch 统一携带
+    nodeId = StringProperty(exclude_if_none=True)
     sensorId = StringProperty()
     type = StringProperty()
     fields = DictProperty(float)
     timestamp = DateTimeProperty(exact=True)
 
-    def __init__(self, node_id: str, sensor_id: str, model: str, fields: Dict[str, float], timestamp: datetime):
+    def __init__(self, node_id: str | dict | None, sensor_id: str | None = None, model: str | None = None,
+                 fields: Dict[str, float] | None = None, timestamp: datetime | None = None):
+        if isinstance(node_id, dict):
+            # 从发件箱恢复时按原始数据构造
+            super().__init__(node_id)
+            return
         super().__init__(nodeId=node_id, sensorId=sensor_id, type=model, fields=fields, timestamp=timestamp)
@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import math
+import os
+import random
+import socket
+import struct
+import time
+import tty
+from asyncio import Task
+from typing import Dict, List, Set, Tuple
+
+from client.network.profile import DeviceProfile, types
+
+logger = logging.getLogger(__name__)
+
+
+def crc16(frame: bytes) -> int:
+    crc = 0xFFFF
+    for byte in frame:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return crc
+
+
+class Faults:
+    def __init__(self, latency: float = 0.005, jitter: float = 0.0, corrupt: float = 0.0, dropout: float = 0.0):
+        # 响应延迟与抖动(秒), 以及产生 CRC 错误与不响应的概率
+        self.latency: float = latency
+        self.jitter: float = jitter
+        self.corrupt: float = corrupt
+        self.dropout: float = dropout
+
+    def delay(self) -> float:
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+
+class VirtualDevice:
+    def __init__(self, slave: int, registers: Dict[int, int] | None = None, faults: Faults | None = None):
+        self.slave: int = slave
+        self.registers: Dict[int, int] = registers if registers is not None else {}
+        self.faults: Faults = faults if faults is not None else Faults()
+        self.online: bool = True
+        self.requests: int = 0
+        self.__profile: DeviceProfile | None = None
+        self.__phase: float = random.uniform(0, math.tau)
+
+    @staticmethod
+    def from_profile(slave: int, profile: DeviceProfile, faults: Faults | None = None) -> 'VirtualDevice':
+        device = VirtualDevice(slave, faults=faults)
+        device.__profile = profile
+        device.update()
+        return device
+
+    def update(self):
+        # 按照设备配置写入缓慢变化的数值, 模拟真实传感器读数
+        if self.__profile is None:
+            return
+        now = time.time()
+        for block in self.__profile.blocks:
+            char, width = types[block.kind]
+            values = []
+            for slot in range(block.length):
+                value = 20.0 + 5.0 * math.sin(now / 600 + self.__phase + slot) + random.uniform(-0.05, 0.05)
+                values.append(value if char in 'fd' else int(value))
+            raw = struct.pack(f'{block.order}{block.length}{char}', *values)
+            registers = struct.unpack(f'{block.packing}{block.count}H', raw)
+            for index, register in enumerate(registers):
+                self.registers[block.address + index] = register
+
+    def read(self, address: int, count: int) -> List[int] | None:
+        self.requests += 1
+        if not all(address + x in self.registers for x in range(count)):
+            return None
+        self.update()
+        return [self.registers[address + x] for x in range(count)]
+
+
+def respond(devices: Dict[int, VirtualDevice], slave: int, function: int, address: int, count: int) -> bytes | None:
+    device = devices.get(slave, None)
+    if device is None or not device.online:
+        return None
+    if function not in (3, 4):
+        return struct.pack('>BB', function | 0x80, 1)
+    registers = device.read(address, count)
+    if registers is None:
+        return struct.pack('>BB', function | 0x80, 2)
+    return struct.pack(f'>BB{count}H', function, count * 2, *registers)
+
+
+class VirtualBus:
+    def __init__(self, devices: List[VirtualDevice]):
+        self.devices: Dict[int, VirtualDevice] = {x.slave: x for x in devices}
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        self.path: str = os.ttyname(self.slave)
+        self.__buffer: bytearray = bytearray()
+        self.__lock: asyncio.Lock = asyncio.Lock()
+        self.__tasks: Set[Task[None]] = set()
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        loop.add_reader(self.master, self.__receive, loop)
+        logger.info(f'虚拟总线 {self.path} 已启动, 设备数量 {len(self.devices)}')
+
+    def close(self, loop: asyncio.AbstractEventLoop):
+        loop.remove_reader(self.master)
+        os.close(self.master)
+        os.close(self.slave)
+
+    def __receive(self, loop: asyncio.AbstractEventLoop):
+        self.__buffer.extend(os.read(self.master, 1024))
+        # 读取请求固定为 8 字节: 从站地址, 功能码, 起始地址, 数量, CRC
+        while len(self.__buffer) >= 8:
+            frame = bytes(self.__buffer[:8])
+            if crc16(frame[:6]) != struct.unpack('<H', frame[6:])[0]:
+                del self.__buffer[0]
+                continue
+            del self.__buffer[:8]
+            task = loop.create_task(self.__respond(frame))
+            self.__tasks.add(task)
+            task.add_done_callback(self.__tasks.discard)
+
+    async def __respond(self, frame: bytes):
+        slave, function, address, count = struct.unpack('>BBHH', frame[:6])
+        device = self.devices.get(slave, None)
+        if device is None or not device.online:
+            return
+        faults = device.faults
+        async with self.__lock:
+            await asyncio.sleep(faults.delay())
+            if random.random() < faults.dropout:
+                return
+            payload = bytes([slave]) + respond(self.devices, slave, function, address, count)
+            crc = crc16(payload)
+            if random.random() < faults.corrupt:
+                crc ^= 0xFFFF
+            os.write(self.master, payload + struct.pack('<H', crc))
+
+
+class VirtualGateway:
+    def __init__(self, devices: List[VirtualDevice], host: str = '127.0.0.1', port: int = 0):
+        # Modbus TCP 网关, 请求按事务标识符并发处理, 可用于验证流水线请求
+        self.devices: Dict[int, VirtualDevice] = {x.slave: x for x in devices}
+        # 创建时即绑定端口, 启动前就能得到地址
+        self.socket: socket.socket = socket.create_server((host, port))
+        self.host: str = host
+        self.port: int = self.socket.getsockname()[1]
+        self.server: asyncio.AbstractServer | None = None
+        self.__tasks: Set[Task[None]] = set()
+
+    @property
+    def path(self) -> str:
+        return f'tcp://{self.host}:{self.port}'
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.__serve, sock=self.socket)
+        logger.info(f'虚拟网关 {self.path} 已启动, 设备数量 {len(self.devices)}')
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        else:
+            self.socket.close()
+        for task in list(self.__tasks):
+            task.cancel()
+
+    async def __serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        lock = asyncio.Lock()
+        try:
+            while True:
+                header = await reader.readexactly(7)
+                tid, _, length, slave = struct.unpack('>HHHB', header)
+                pdu = await reader.readexactly(length - 1)
+                if len(pdu) < 5:
+                    continue
+                function, address, count = struct.unpack('>BHH', pdu[:5])
+                task = asyncio.create_task(self.__respond(writer, lock, tid, slave, function, address, count))
+                self.__tasks.add(task)
+                task.add_done_callback(self.__tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+
+    async def __respond(self, writer: asyncio.StreamWriter, lock: asyncio.Lock,
+                        tid: int, slave: int, function: int, address: int, count: int):
+        device = self.devices.get(slave, None)
+        if device is None or not device.online:
+            return
+        await asyncio.sleep(device.faults.delay())
+        if random.random() < device.faults.dropout:
+            return
+        payload = respond(self.devices, slave, function, address, count)
+        async with lock:
+            writer.write(struct.pack('>HHHB', tid, 0, len(payload) + 1, slave) + payload)
+            await writer.drain()
+
+
+class Farm:
+    def __init__(self):
+        self.buses: List[VirtualBus] = []
+        self.gateways: List[VirtualGateway] = []
+
+    def add(self, devices: List[VirtualDevice], gateway: bool = False) -> str:
+        if gateway:
+            server = VirtualGateway(devices)
+            self.gateways.append(server)
+            return server.path
+        bus = VirtualBus(devices)
+        self.buses.append(bus)
+        return bus.path
+
+    def populate(self, profile: DeviceProfile, count: int, per_bus: int = 16,
+                 faults: Faults | None = None, gateway: bool = False) -> List[Tuple[str, int]]:
+        # 按每条总线(或每个 Modbus TCP 网关) per_bus 个设备创建虚拟设备, 返回 (端口, 从站地址)
+        ports = []
+        for start in range(0, count, per_bus):
+            devices = [VirtualDevice.from_profile(slave, profile, faults)
+                       for slave in range(1, min(per_bus, count - start) + 1)]
+            path = self.add(devices, gateway)
+            ports.extend((path, x.slave) for x in devices)
+        return ports
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        for bus in self.buses:
+            bus.start(loop)
+        for gateway in self.gateways:
+            loop.run_until_complete(gateway.start())
+
+    def close(self, loop: asyncio.AbstractEventLoop):
+        for bus in self.buses:
+            bus.close(loop)
+        for gateway in self.gateways:
+            loop.run_until_complete(gateway.close())
@@ -0,0 +1,331 @@
+import logging
+import os
+import queue
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from queue import Queue
+from threading import Lock, Thread
+from typing import Dict, List, Tuple
+
+import numpy
+from numpy import ndarray
+
+from client.abstract.meta import Singleton
+from client.network.gorilla import Chunk, decode
+from client.network.rollup import offset
+from client.network.segment import Segments
+
+logger = logging.getLogger(__name__)
+schema = '''
+CREATE TABLE IF NOT EXISTS chunks (
+    sensor TEXT NOT NULL,
+    field TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    end INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    minimum REAL NOT NULL,
+    maximum REAL NOT NULL,
+    total REAL NOT NULL,
+    data BLOB NOT NULL,
+    PRIMARY KEY (sensor, field, start)
+)
+'''
+# 数据块不跨越整点, 小时及以上粒度的聚合可以直接使用块内的统计值
+span = 3600
+ChunkRow = Tuple[int, int, int, float, float, float, bytes]
+
+
+def partition(timestamp: int) -> str:
+    return datetime.fromtimestamp(timestamp).strftime('%Y%m%d')
+
+
+class StorageThread(Thread):
+    def __init__(self, storage: 'Storage'):
+        super().__init__(daemon=True)
+        self.storage: Storage = storage
+        self.queue: Queue[Tuple[str, str, int, float] | None] = Queue()
+        self.lock: Lock = Lock()
+        self.__chunks: Dict[Tuple[str, str], Chunk] = {}
+        self.__connections: Dict[str, sqlite3.Connection] = {}
+        self.__today: str | None = None
+
+    def run(self):
+        logger.info('线程已启动')
+        running = True
+        while running:
+            batch: List[Tuple[str, str, int, float]] = []
+            deadline = time.monotonic() + self.storage.flush_interval
+            # 攒够一批或等待超时后统一处理, 减少加锁次数
+            while len(batch) < self.storage.batch_size:
+                try:
+                    item = self.queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                batch.append(item)
+            self.__write(batch, not running)
+            self.__rotate()
+        for connection in self.__connections.values():
+            connection.close()
+        self.__connections.clear()
+        logger.info('线程准备结束')
+
+    def snapshot(self, sensor: str, field: str) -> ChunkRow | None:
+        with self.lock:
+            chunk = self.__chunks.get((sensor, field), None)
+            if chunk is None:
+                return None
+            return chunk.start, chunk.end, chunk.count, chunk.minimum, chunk.maximum, chunk.total, chunk.to_bytes()
+
+    def __boundary(self, timestamp: int) -> int:
+        return timestamp - (timestamp + self.storage.offset) % span
+
+    def __write(self, batch: List[Tuple[str, str, int, float]], final: bool):
+        # 样本先追加到内存中的压缩数据块, 数据块写满, 跨越整点或存在时间过长时才写入磁盘
+        with self.lock:
+            sealed: List[Tuple[Tuple[str, str], Chunk]] = []
+            for sensor, field, timestamp, value in batch:
+                key = (sensor, field)
+                chunk = self.__chunks.get(key, None)
+                if chunk is not None and timestamp <= chunk.end:
+                    continue
+                if chunk is not None and (chunk.count >= self.storage.chunk_size or
+                                          self.__boundary(chunk.start) != self.__boundary(timestamp)):
+                    sealed.append((key, chunk))
+                    chunk = None
+                if chunk is None:
+                    chunk = Chunk()
+                    self.__chunks[key] = chunk
+                chunk.append(timestamp, value)
+            now = time.time()
+            # 跨日后立即写入前一天的数据块, 以便转换为列文件
+            midnight = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+            for key, chunk in list(self.__chunks.items()):
+                if final or now - chunk.start >= self.storage.seal_interval or chunk.start < midnight:
+                    sealed.append((key, self.__chunks.pop(key)))
+            if len(sealed) > 0:
+                self.__seal(sealed)
+
+    def __seal(self, sealed: List[Tuple[Tuple[str, str], Chunk]]):
+        partitions: Dict[str, List[Tuple[str, str, int, int, int, float, float, float, bytes]]] = {}
+        for (sensor, field), chunk in sealed:
+            partitions.setdefault(partition(chunk.start), []).append(
+                (sensor, field, chunk.start, chunk.end, chunk.count,
+                 chunk.minimum, chunk.maximum, chunk.total, chunk.to_bytes()))
+        for name, rows in partitions.items():
+            try:
+                connection = self.__connection(name)
+                with connection:
+                    connection.executemany('INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            except sqlite3.Error as ex:
+                logger.error(f'写入历史数据分区 {name} 时遇到问题: {ex}', exc_info=ex)
+
+    def __connection(self, name: str) -> sqlite3.Connection:
+        connection = self.__connections.get(name, None)
+        if connection is None:
+            connection = sqlite3.connect(self.storage.path(name))
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(schema)
+            self.__connections[name] = connection
+        return connection
+
+    def __rotate(self):
+        # 跨日后关闭前一天的分区, 清理过期分区并将已结束的分区转换为列文件
+        today = partition(int(time.time()))
+        for name in [x for x in self.__connections.keys() if x < today]:
+            self.__connections.pop(name).close()
+        if today == self.__today:
+            return
+        self.__today = today
+        self.storage.expire()
+        self.__compact(today)
+
+    def __compact(self, today: str):
+        segments = self.storage.segments
+        sealed = segments.sealed
+        midnight = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        threshold = midnight - timedelta(days=min(self.storage.mapped, self.storage.retention))
+        for name in self.storage.partitions():
+            if name >= today or (sealed is not None and name <= sealed):
+                continue
+            if name >= threshold.strftime('%Y%m%d'):
+                try:
+                    self.__convert(name)
+                except (sqlite3.Error, OSError, ValueError) as ex:
+                    logger.error(f'转换历史数据分区 {name} 时遇到问题: {ex}', exc_info=ex)
+                    return
+            segments.sealed = name
+        segments.trim(int(threshold.timestamp()))
+
+    def __convert(self, name: str):
+        timestamp = time.time()
+        connection = sqlite3.connect(f'file:{self.storage.path(name)}?mode=ro', uri=True)
+        try:
+            rows = connection.execute('SELECT sensor, field, count, data FROM chunks '
+                                      'ORDER BY sensor, field, start').fetchall()
+        finally:
+            connection.close()
+        series: Dict[Tuple[str, str], List[Tuple[ndarray, ndarray]]] = {}
+        for sensor, field, count, data in rows:
+            series.setdefault((sensor, field), []).append(decode(data, count))
+        for (sensor, field), chunks in series.items():
+            self.storage.segments.get(sensor, field).append(numpy.concatenate([x[0] for x in chunks]),
+                                                            numpy.concatenate([x[1] for x in chunks]))
+        elapsed = int((time.time() - timestamp) * 1000)
+        logger.info(f'已将历史数据分区 {name} 转换为列文件({elapsed}ms), 序列数量 {len(series)}')
+
+
+class Storage(metaclass=Singleton):
+    def __init__(self, directory: str = 'history', retention: int = 90, batch_size: int = 512,
+                 flush_interval: float = 5.0, chunk_size: int = 256, seal_interval: float = 900.0, mapped: int = 30):
+        # seal_interval 为数据块在内存中停留的最长时间, 也是异常退出时最多丢失的时长
+        # 最近 mapped 天已结束的分区额外保存为未压缩的列文件, 读取时直接映射到内存
+        self.directory: str = directory
+        self.retention: int = retention
+        self.batch_size: int = batch_size
+        self.flush_interval: float = flush_interval
+        self.chunk_size: int = chunk_size
+        self.seal_interval: float = seal_interval
+        self.offset: int = offset()
+        self.mapped: int = mapped
+        self.segments: Segments = Segments(os.path.join(directory, 'segments'))
+        self.thread: StorageThread | None = None
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, f'{name}.db')
+
+    def partitions(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(x[:-3] for x in os.listdir(self.directory) if x.endswith('.db'))
+
+    def launch(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self.thread = StorageThread(self)
+        self.thread.start()
+
+    def stop(self, timeout: float | None = None):
+        if self.thread is None or not self.thread.is_alive():
+            return
+        self.thread.queue.put(None)
+        self.thread.join(timeout)
+
+    def write(self, sensor: str, field: str, timestamp: int, value: float):
+        if self.thread is None or not self.thread.is_alive():
+            self.launch()
+        self.thread.queue.put((sensor, field, timestamp, value))
+
+    def expire(self):
+        threshold = (datetime.now() - timedelta(days=self.retention)).strftime('%Y%m%d')
+        for name in self.partitions():
+            if name >= threshold:
+                continue
+            for suffix in ('', '-wal', '-shm'):
+                path = self.path(name) + suffix
+                if os.path.exists(path):
+                    os.remove(path)
+            logger.info(f'已删除过期的历史数据分区 {name}')
+
+    def __chunks(self, sensor: str, field: str, start: int, end: int) -> List[ChunkRow]:
+        # 先获取内存中的数据块再读取磁盘, 期间写入磁盘的数据块按起始时间去重
+        opened = self.thread.snapshot(sensor, field) if self.thread is not None else None
+        first, last = partition(start), partition(end)
+        chunks: List[ChunkRow] = []
+        for name in self.partitions():
+            if name < first or name > last:
+                continue
+            try:
+                connection = sqlite3.connect(f'file:{self.path(name)}?mode=ro', uri=True)
+            except sqlite3.Error:
+                continue
+            try:
+                chunks.extend(connection.execute('SELECT start, end, count, minimum, maximum, total, data '
+                                                 'FROM chunks WHERE sensor = ? AND field = ? AND start < ? AND end >= ? '
+                                                 'ORDER BY start', (sensor, field, end, start)).fetchall())
+            except sqlite3.Error as ex:
+                logger.warning(f'读取历史数据分区 {name} 时遇到问题: {ex}')
+                continue
+            finally:
+                connection.close()
+        if opened is not None and opened[0] < end and opened[1] >= start:
+            chunks = [x for x in chunks if x[0] != opened[0]]
+            chunks.append(opened)
+        return chunks
+
+    def aggregate(self, sensor: str, field: str, start: int, end: int,
+                  width: int, offset: int) -> List[Tuple[int, float, float, float, int]]:
+        # 按 width 秒聚合: (桶起始时间, 最小值, 最大值, 总和, 数量)
+        buckets: List[Tuple[int, float, float, float, int]] = []
+        if width % span == 0 and offset == self.offset:
+            # 数据块与桶对齐, 无需解码
+            start = start - (start + offset) % width
+            for chunk in self.__chunks(sensor, field, start, end):
+                if chunk[0] < start:
+                    continue
+                row = (chunk[0] - (chunk[0] + offset) % width, chunk[3], chunk[4], chunk[5], chunk[2])
+                if len(buckets) > 0 and buckets[-1][0] == row[0]:
+                    previous = buckets[-1]
+                    row = (row[0], min(previous[1], row[1]), max(previous[2], row[2]),
+                           previous[3] + row[3], previous[4] + row[4])
+                    buckets[-1] = row
+                else:
+                    buckets.append(row)
+            return buckets
+        timestamps, values = self.read(sensor, field, start, end)
+        if len(timestamps) <= 0:
+            return buckets
+        starts = timestamps - (timestamps + offset) % width
+        keys, indexes = numpy.unique(starts, return_index=True)
+        minimum = numpy.minimum.reduceat(values, indexes)
+        maximum = numpy.maximum.reduceat(values, indexes)
+        total = numpy.add.reduceat(values, indexes)
+        count = numpy.diff(numpy.append(indexes, len(values)))
+        return list(zip(keys.tolist(), minimum.tolist(), maximum.tolist(), total.tolist(), count.tolist()))
+
+    def views(self, sensor: str, field: str, start: int, end: int) -> List[Tuple[ndarray, ndarray]]:
+        # 已转换为列文件的部分直接返回内存映射的只读视图, 其余部分从数据块解码
+        # 供按原始样本读取的场景使用(read 以及步长小于内存聚合的 Monitor.query); 仪表盘趋势图使用内存中的聚合数据
+        segment = self.segments.get(sensor, field)
+        timestamps, _ = segment.view()
+        if len(timestamps) <= 0:
+            return [self.__decode(sensor, field, start, end)]
+        first, last = int(timestamps[0]), int(timestamps[-1]) + 1
+        views: List[Tuple[ndarray, ndarray]] = []
+        if start < first:
+            views.append(self.__decode(sensor, field, start, min(end, first)))
+        if end > first and start < last:
+            views.append(segment.range(max(start, first), min(end, last)))
+        if end > last:
+            views.append(self.__decode(sensor, field, max(start, last), end))
+        return [x for x in views if len(x[0]) > 0]
+
+    def read(self, sensor: str, field: str, start: int, end: int) -> Tuple[ndarray, ndarray]:
+        views = self.views(sensor, field, start, end)
+        if len(views) <= 0:
+            return numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.float64)
+        if len(views) == 1:
+            return views[0]
+        return numpy.concatenate([x[0] for x in views]), numpy.concatenate([x[1] for x in views])
+
+    def __decode(self, sensor: str, field: str, start: int, end: int) -> Tuple[ndarray, ndarray]:
+        timestamps: List[ndarray] = []
+        values: List[ndarray] = []
+        for chunk in self.__chunks(sensor, field, start, end):
+            try:
+                decoded = decode(chunk[6], chunk[2])
+            except ValueError as ex:
+                logger.warning(f'解码传感器 {sensor} 字段 {field} 的数据块 {chunk[0]} 时遇到问题: {ex}')
+                continue
+            timestamps.append(decoded[0])
+            values.append(decoded[1])
+        if len(timestamps) <= 0:
+            return numpy.zeros(0, dtype=numpy.int64), numpy.zeros(0, dtype=numpy.float64)
+        timestamps, values = numpy.concatenate(timestamps), numpy.concatenate(values)
+        mask = (timestamps >= start) & (timestamps < end)
+        return timestamps[mask], values[mask]
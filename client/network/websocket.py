@@ -3,28 +3,66 @@ import logging
 import time
 from asyncio import Task, AbstractEventLoop
 from concurrent.futures import Future
-from threading import Thread
+from enum import Enum
+from threading import Thread, current_thread
+from typing import Callable, Dict, List
 
 from websockets.client import connect, WebSocketClientProtocol
-from websockets.exceptions import InvalidStatusCode
+from websockets.exceptions import InvalidStatusCode, ConnectionClosed
 
 from client.abstract.meta import Singleton
+from client.config.cached import Cached
+from client.network.incoming import Dispatcher
+from client.network.serializable import Sensor, SensorStructure
+from client.network.compact import Handles
+from client.network.outgoing import SendQueue, Envelope, coalesce
 from client.ui.window import MainWindow
+from client.util.backoff import Backoff
 
 logger = logging.getLogger(__name__)
 
 
+class Liveness(Enum):
+    CONNECTING = 0
+    ONLINE = 1
+    RECONNECTING = 2
+    OFFLINE = 3
+
+
 class Connection(Thread):
-    def __init__(self, window: MainWindow | None, token: str, connected: Future[None]):
+    def __init__(self, window: MainWindow | None, token: str, connected: Future[None], backoff: Backoff | None = None,
+                 queue: SendQueue | None = None, frame_size: int = 64, dispatcher: Dispatcher | None = None):
         super().__init__()
         self.__localhost: bool = False
         self.__window: MainWindow | None = window
         self.__token: str = token
         self.__connected: Future[None] = connected
+        self.__backoff: Backoff = backoff if backoff is not None else Backoff(initial=1.0, maximum=60.0)
+        # 连接保持超过该时长(秒)才视为稳定, 重置重连间隔
+        self.stable: float = 30.0
+        self.retry_at: float | None = None
+        # 所有发送都经由有界队列, 由单个写入任务按顺序发送; frame_size 为合并后每个数据包包含的最大报告数量
+        self.queue: SendQueue = queue if queue is not None else SendQueue()
+        self.queue.notify = self.__notify
+        self.frame_size: int = frame_size
+        # 收到的数据包交由调度器执行, 读取循环不等待处理结果
+        self.dispatcher: Dispatcher = dispatcher if dispatcher is not None else Dispatcher()
+        # 每次连接时与服务端协商, 未协商成功时使用 JSON
+        from client.abstract.serialize import Codec, codecs
+        self.codec: Codec = codecs['json']
+        # 服务端同意使用紧凑报告格式时, 句柄表在 SensorHandles 写入连接后即启用, 不等待服务端回复;
+        # 同一连接内数据按序到达, 服务端总是先收到句柄表再收到紧凑报告
+        self.compact: bool = False
+        self.handles: Handles | None = None
+        self.__session: int = 0
 
         self.__loop: AbstractEventLoop = asyncio.new_event_loop()
         self.__task: Task[None] | None = None
         self.__client: WebSocketClientProtocol | None = None
+        self.__state: Liveness = Liveness.CONNECTING
+        self.__stopping: asyncio.Event = asyncio.Event()
+        self.__wake: asyncio.Event = asyncio.Event()
+        self.__inflight: List[Envelope] = []
 
     @property
     def window(self) -> MainWindow | None:
@@ -46,10 +84,45 @@ class Connection(Thread):
     def client(self) -> WebSocketClientProtocol | None:
         return self.__client
 
+    @property
+    def online(self) -> bool:
+        return self.is_alive() and self.client is not None and self.client.open
+
+    @property
+    def state(self) -> Liveness:
+        return self.__state
+
+    @property
+    def retry_in(self) -> float | None:
+        if self.retry_at is None:
+            return None
+        return max(0.0, self.retry_at - time.monotonic())
+
+    def __change(self, state: Liveness):
+        if state == self.__state:
+            return
+        self.__state = state
+        logger.info(f'连接状态已变更为 {state.name}')
+        for listener in list(Client().listeners):
+            try:
+                listener(state)
+            except Exception as ex:
+                logger.error(f'通知连接状态时遇到问题: {ex}', exc_info=ex)
+
     def run(self):
         logger.info('线程已启动')
         asyncio.set_event_loop(self.loop)
+        writer = self.loop.create_task(self.__write())
         self.loop.run_until_complete(self.__online())
+        self.loop.run_until_complete(self.dispatcher.cancel())
+        writer.cancel()
+        try:
+            self.loop.run_until_complete(writer)
+        except asyncio.CancelledError:
+            pass
+        for envelope in self.__inflight:
+            envelope.resolve(False)
+        self.queue.close()
         logger.info('线程准备结束')
 
     def stop(self, code: int = 1000, reason: str = 'Client offline') -> Future[None]:
@@ -61,66 +134,165 @@ class Connection(Thread):
         # self.loop.create_task(self.__offline(code, reason))
         return asyncio.run_coroutine_threadsafe(self.__offline(code, reason), self.loop)
 
-    def send(self, packet) -> Future[None]:
-        name = type(packet).__name__
+    def send(self, packet) -> Future[bool]:
         from client.abstract.packet import OutgoingPacket
         assert isinstance(packet, OutgoingPacket), '无效的 packet 对象'
         if not self.is_alive():
             logger.info('线程已经结束, 无法发送数据')
             future = Future()
-            future.set_result(None)
+            future.set_result(False)
             return future
-        # self.loop.create_task(self.__send(message))
-        from client.abstract.serialize import serialize
-        return asyncio.run_coroutine_threadsafe(self.__send(serialize(packet), name), self.loop)
+        # 连接线程内发送时不能阻塞等待写入任务
+        return self.queue.put(packet, current_thread() is not self)
+
+    def announce(self, node_id: str, sensors: List[Sensor], structures: Dict[str, SensorStructure]):
+        if not self.compact:
+            return
+        from client.network.serializable.packet import SensorHandles
+        handles = Handles(sensors, structures)
+        session = self.__session
+
+        def activate(future: Future[bool]):
+            # 由写入任务在发送完成后立即调用, 之后取出的报告才会使用新的句柄
+            if session != self.__session or future.cancelled() or future.exception() is not None:
+                return
+            if future.result():
+                self.handles = handles
+                logger.info(f'已启用紧凑报告格式, 共 {len(handles.sensors)} 个传感器句柄')
+
+        self.send(SensorHandles(node_id, handles.sensors)).add_done_callback(activate)
+
+    def __notify(self):
+        try:
+            self.loop.call_soon_threadsafe(self.__wake.set)
+        except RuntimeError:
+            # 事件循环已关闭, 剩余数据由 SendQueue.close 处理
+            pass
+
+    async def __write(self):
+        while True:
+            await self.__wake.wait()
+            self.__wake.clear()
+            while len(self.queue) > 0:
+                self.__inflight = self.queue.take(self.frame_size)
+                for packet, envelopes in coalesce(self.__inflight, self.frame_size):
+                    if self.handles is not None:
+                        packet = self.handles.compact(packet) or packet
+                    name = type(packet).__name__
+                    try:
+                        success = await self.__send(self.codec.encode(packet), name)
+                    except Exception as ex:
+                        logger.warning(f'发送 {name} 时遇到问题: {ex}')
+                        success = False
+                    self.queue.metrics.write(len(envelopes), success)
+                    for envelope in envelopes:
+                        envelope.resolve(success)
+                self.__inflight = []
 
     async def __online(self):
         if self.client is not None:
             logger.warning('客户端已初始化')
             return
-        logger.info('客户端准备上线')
-        timestamp = time.time()
-        try:
-            base_url = 'ws://0.0.0.0:8080' if self.__localhost else 'wss://api.entityparrot.cc/smartpond'
-            self.__client = await connect(f'{base_url}/client',
-                                          extra_headers={'Authorization': f'Bearer {self.token}'})
-        except Exception as ex:
-            if isinstance(ex, InvalidStatusCode) and ex.status_code == 401:
-                logger.info('登录凭证已失效')
-                if self.window is not None:
-                    from client.ui.page.auth import LoginPage
-                    self.window.builder.emit([LoginPage, self.window])
-                return
-            logger.critical(f'上线时遇到错误: {ex}', exc_info=ex)
-            # TODO show critical window then exit
-            return
-        elapsed = int((time.time() - timestamp) * 1000)
-        logger.info(f'客户端已上线({elapsed}ms)')
-        self.__connected.set_result(None)
-        await self.__listen()
+        from client.abstract.serialize import codecs, negotiate
+        from client.network.outbox import Outbox
+        base_url = 'ws://0.0.0.0:8080' if self.__localhost else 'wss://api.entityparrot.cc/smartpond'
+        delay = 0.0
+        while True:
+            if delay > 0 and not self.__stopping.is_set():
+                # 等待期间停止连接会被立即唤醒
+                self.retry_at = time.monotonic() + delay
+                self.__change(Liveness.RECONNECTING)
+                try:
+                    await asyncio.wait_for(self.__stopping.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                self.retry_at = None
+            if self.__stopping.is_set():
+                break
+            logger.info('客户端准备上线')
+            timestamp = time.time()
+            headers = {'Authorization': f'Bearer {self.token}'}
+            # 告知服务端最后送达的报告序号, 之后的报告由发件箱补发
+            acknowledged = Outbox().acknowledged
+            if acknowledged is not None:
+                headers['X-Last-Report-Index'] = str(acknowledged)
+            # 按偏好顺序列出本地支持的编码, 由服务端在握手响应中选择
+            headers['X-Packet-Codec'] = ', '.join(codecs)
+            headers['X-Report-Format'] = 'compact'
+            try:
+                self.__client = await connect(f'{base_url}/client', extra_headers=headers)
+            except Exception as ex:
+                if isinstance(ex, InvalidStatusCode) and ex.status_code == 401:
+                    logger.info('登录凭证已失效')
+                    if self.window is not None:
+                        from client.ui.page.auth import LoginPage
+                        self.window.builder.emit([LoginPage, self.window])
+                    break
+                delay = self.__backoff.next()
+                logger.warning(f'上线时遇到错误, 将在 {delay:.1f}s 后重试: {ex}')
+                continue
+            self.codec = negotiate(self.__client.response_headers.get('X-Packet-Codec', None))
+            # 句柄只在单次连接内有效, 重新连接后需要重新下发
+            self.__session += 1
+            self.handles = None
+            self.compact = self.__client.response_headers.get('X-Report-Format', '').strip().lower() == 'compact'
+            # 重新连接后服务端不一定重新下发 Profile, 使用缓存的配置重新下发句柄表
+            profile = Cached().profile
+            if self.compact and profile is not None:
+                self.announce(profile.node.id, profile.sensors, profile.structures)
+            elapsed = int((time.time() - timestamp) * 1000)
+            logger.info(f'客户端已上线({elapsed}ms), 使用 {self.codec.name} 编码')
+            online_at = time.monotonic()
+            self.__change(Liveness.ONLINE)
+            if not self.__connected.done():
+                self.__connected.set_result(None)
+            try:
+                await self.__listen()
+            except Exception as ex:
+                # 任何未预料的错误都只结束本次连接, 由下方的重连逻辑接管
+                logger.error(f'接收数据时遇到错误, 关闭连接: {ex}', exc_info=ex)
+                try:
+                    await self.__client.close(1011, 'Client error')
+                except Exception as closing:
+                    logger.warning(f'关闭连接时遇到问题: {closing}')
+            if time.monotonic() - online_at >= self.stable:
+                self.__backoff.reset()
+            delay = self.__backoff.next()
+            if not self.__stopping.is_set():
+                logger.warning(f'与服务器的连接已断开, 将在 {delay:.1f}s 后重新连接')
+        self.__change(Liveness.OFFLINE)
 
     async def __listen(self):
         from client.abstract.serialize import deserialize
         from client.abstract.packet import IncomingPacket
-        async for payload in self.__client:
-            if not isinstance(payload, str):
-                logger.warning(f'<!- {payload.hex()}')
-                continue
-            packet = deserialize(payload)
-            name = type(packet).__name__
-            if not isinstance(packet, IncomingPacket):
-                logger.warning(f'<!- ({name}) {payload}')
-                continue
-            logger.info(f'<-- ({name}) {payload}')
-            logger.info(str(packet.to_json()))
-            try:
-                await packet.execute(self, Client(), self.window)
-            except Exception as ex:
-                logger.error(f'执行数据包时遇到错误: {ex}', exc_info=ex)
-                # TODO maybe message box
+        try:
+            async for payload in self.__client:
+                text = payload if isinstance(payload, str) else f'{len(payload)} bytes'
+                try:
+                    if isinstance(payload, str):
+                        packet = deserialize(payload)
+                    elif self.codec.binary:
+                        packet = self.codec.decode(payload)
+                    else:
+                        logger.warning(f'<!- {payload.hex()}')
+                        continue
+                except Exception as ex:
+                    # 单个无法解析的数据包不影响连接
+                    logger.error(f'<!- 无法解析的数据包 {text}: {ex}')
+                    continue
+                name = type(packet).__name__
+                if not isinstance(packet, IncomingPacket):
+                    logger.warning(f'<!- ({name}) {text}')
+                    continue
+                logger.info(f'<-- ({name}) {text}')
+                logger.info(str(packet.to_json()))
+                self.dispatcher.dispatch(packet.key, name, lambda x=packet: x.execute(self, Client(), self.window))
+        except ConnectionClosed as ex:
+            logger.warning(f'连接异常关闭: {ex}')
         logger.info('客户端已停止数据接收')
 
     async def __offline(self, code: int, reason: str):
+        self.__stopping.set()
         if self.client is None:
             logger.warning('客户端未初始化')
             return
@@ -133,18 +305,21 @@ class Connection(Thread):
         elapsed = int((time.time() - timestamp) * 1000)
         logger.info(f'客户端已离线({elapsed}ms)')
 
-    async def __send(self, message: str, name: str = 'PlainText'):
+    async def __send(self, message: str | bytes, name: str = 'PlainText') -> bool:
         if self.client is None or not self.client.open:
             logger.warning('客户端未在线, 无法发送数据')
-            return
-        logger.info(f'--> ({name}) {message}')
+            return False
+        logger.info(f'--> ({name}) {message if isinstance(message, str) else f"{len(message)} bytes"}')
         await self.client.send(message)
+        return True
 
 
 class Client(metaclass=Singleton):
     def __init__(self):
         self.__window: MainWindow | None = None
         self.__connection: Connection | None = None
+        # 连接状态变化时在连接线程中调用
+        self.listeners: List[Callable[[Liveness], None]] = []
 
     @property
     def window(self) -> MainWindow | None:
@@ -154,6 +329,12 @@ class Client(metaclass=Singleton):
     def connection(self) -> Connection | None:
         return self.__connection
 
+    @property
+    def state(self) -> Liveness:
+        if self.__connection is None:
+            return Liveness.OFFLINE
+        return self.__connection.state
+
     def bind(self, window: MainWindow):
         self.__window = window
 
@@ -5,6 +5,7 @@ from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QSpacer
 
 from client.config.cached import Cached
 from client.network.monitor import Monitors
+from client.network.websocket import Client, Liveness
 from client.ui.widget.dashboard import SensorViewWidget
 from client.ui.window import MainWindow
 
@@ -52,6 +53,12 @@ class DashboardPage(QWidget):
         self.profile.addWidget(self.pond)
         self.pond.setObjectName('pond')
 
+        self.liveness = QLabel()
+        self.profile.addWidget(self.liveness)
+        self.liveness.setObjectName('liveness')
+        self.set_liveness(Client().state)
+        self.window.liveness.connect(self.set_liveness)
+
         self.header_space = QSpacerItem(40, 20, QSizePolicy.Expanding, QSizePolicy.Minimum)
         self.header_layout.addItem(self.header_space)
 
@@ -117,3 +124,15 @@ class DashboardPage(QWidget):
     def __to_sensor_creation(self):
         from client.ui.page.sensor import SensorCreatePage
         self.window.builder.emit([SensorCreatePage, self.window])
+
+    def set_liveness(self, state: Liveness):
+        if state == Liveness.ONLINE:
+            self.liveness.setText('服务器已连接')
+        elif state == Liveness.RECONNECTING:
+            connection = Client().connection
+            retry_in = connection.retry_in if connection is not None else None
+            self.liveness.setText('正在重新连接' if retry_in is None else f'连接已断开, {retry_in:.0f}s 后重新连接')
+        elif state == Liveness.CONNECTING:
+            self.liveness.setText('正在连接至服务器')
+        else:
+            self.liveness.setText('服务器未连接')
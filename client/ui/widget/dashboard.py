@@ -1,5 +1,6 @@
 import copy
 import logging
+import time
 from typing import Dict
 
 from PySide6.QtCore import Qt, Signal
@@ -7,6 +8,7 @@ from PySide6.QtGui import QFont
 from PySide6.QtWidgets import QGroupBox, QVBoxLayout, QHBoxLayout, QLabel, QSizePolicy, QSpacerItem, QPushButton, \
     QGridLayout
 
+from client.network.breaker import BreakerState
 from client.network.monitor import Monitor
 from client.ui.widget.sensor import SensorFieldWidget
 
@@ -37,7 +39,7 @@ class SensorViewWidget(QGroupBox):
         self.header.setSpacing(10)
         self.header.setContentsMargins(0, 0, 0, 0)
 
-        self.online = QLabel('在线' if monitor.is_online else '离线')
+        self.online = QLabel(self.state())
         self.header.addWidget(self.online)
         self.online.setSizePolicy(QSizePolicy.Policy.Preferred, QSizePolicy.Policy.Maximum)
 
@@ -73,11 +75,29 @@ class SensorViewWidget(QGroupBox):
         self.label.show()
         self.label.setText(message)
 
+    def state(self) -> str:
+        state = self.monitor.state
+        match state:
+            case BreakerState.OPEN:
+                retry = self.monitor.retry_in
+                return '离线' if retry is None else f'离线 ({int(retry)}s 后重试)'
+            case BreakerState.HALF_OPEN:
+                return '正在重试'
+            case _:
+                return '在线' if self.monitor.is_online else '离线'
+
     def pull(self):
         # TODO btn
-        self.label.hide()
+        self.online.setText(self.state())
+        if self.monitor.state != BreakerState.CLOSED or not self.monitor.is_online:
+            self.message('无法连接至传感器')
+            return
         values = copy.deepcopy(self.monitor.last_values)
-        trends = copy.deepcopy(self.monitor.history)
+        if values is None:
+            self.message('正在等待传感器')
+            return
+        self.label.hide()
+        now = int(time.time())
         indexes: Dict[str, SensorFieldWidget] = {}
         for key, value in values.items():
             widget = self.indexes.get(key, None)
@@ -85,7 +105,8 @@ class SensorViewWidget(QGroupBox):
                 field = self.monitor.structure.fields[key]
                 widget = SensorFieldWidget(field.name, field.unit)
             widget.set_value(str(round(value, 2)))
-            widget.set_trend(trends.get(key, {}))
+            # 最近一小时的每分钟均值, 由内存中的聚合数据提供
+            widget.set_trend(*self.monitor.query(key, now - 3600, now, 60))
             indexes[key] = widget
         self.arrange(indexes)
 
@@ -1,5 +1,6 @@
 import copy
 import logging
+import math
 from concurrent.futures import Future
 from datetime import datetime, timedelta
 from typing import List, Dict, Tuple, Set
@@ -148,12 +149,13 @@ class SensorViewWidget(QWidget):
         self.arrange()
 
     def redraw(self):
-        history = self.monitor.history
-        for key, values in history.items():
-            if key not in self.indexes:
-                continue
-            _, trend = self.indexes[key]
-            trend.set_value(values)
+        now = int(datetime.now().timestamp())
+        for key, widgets in self.indexes.items():
+            _, trend = widgets
+            timestamps, values = self.monitor.query(key, now - 3600, now, 60)
+            # 没有数据的分钟为 NaN, 交给趋势图按 0 补齐
+            trend.set_value({datetime.fromtimestamp(x): y for x, y in zip(timestamps.tolist(), values.tolist())
+                             if not math.isnan(y)})
 
     def arrange(self):
         keys = set(self.indexes.keys())
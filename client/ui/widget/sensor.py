@@ -1,6 +1,7 @@
-from datetime import datetime, timedelta
-from typing import Dict
+from datetime import datetime
 
+import numpy
+from numpy import ndarray
 from PySide6.QtCore import Signal
 from PySide6.QtWidgets import QWidget
 from pyqtgraph import PlotWidget, AxisItem, mkPen
@@ -17,7 +18,7 @@ class SensorCreateWidget(QWidget, Ui_SensorCreate):
 
 class SensorFieldWidget(QWidget, Ui_SensorField):
     field = Signal(str)
-    history = Signal(dict)
+    history = Signal(object, object)
 
     def __init__(self, name: str, unit: str):
         super().__init__()
@@ -42,33 +43,19 @@ class SensorFieldWidget(QWidget, Ui_SensorField):
     def set_value(self, value: str):
         self.value.setText(value)
 
-    def set_trend(self, values: Dict[datetime, float]):
-        if len(values) <= 0:
+    def set_trend(self, timestamps: ndarray, values: ndarray):
+        if len(values) <= 0 or numpy.isnan(values).all():
             self.message('暂无数据')
             return
         self.status.hide()
         self.canvas.show()
-        expanded: Dict[str, float] = {}
-        start = datetime.now()
-        end = start - timedelta(hours=1)
-        cursor = start
-        while cursor > end:
-            key = cursor.strftime('%H:%M')
-            found: datetime | None = None
-            for timestamp, value in values.items():
-                if timestamp.hour == cursor.hour and timestamp.minute == cursor.minute:
-                    expanded[key] = value
-                    found = timestamp
-            if found is None:
-                expanded[key] = 0.0
-            else:
-                values.pop(found)
-            cursor -= timedelta(minutes=1)
+        # 按时间对齐的数据, 最新的位于最左侧
+        slots = values[::-1]
+        keys = [datetime.fromtimestamp(x).strftime('%H:%M') for x in timestamps[::-1].tolist()]
 
         self.canvas.clear()
         x = {}
-        y = list(expanded.values())
-        keys = list(expanded.keys())
+        y = slots
         for index in range(len(keys)):
             num = index + 1
             if num == 1 or num % 10 == 0:
@@ -80,4 +67,4 @@ class SensorFieldWidget(QWidget, Ui_SensorField):
         # xAxis = AxisItem(orientation='bottom')
         xAxis.setTicks([x.items()])
         pen = mkPen(color=(77, 81, 87), width=2)
-        self.canvas.plot(list(x.keys()), y, pen=pen, axisItems={'bottom': xAxis})
+        self.canvas.plot(list(x.keys()), y, pen=pen, connect='finite', axisItems={'bottom': xAxis})
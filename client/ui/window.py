@@ -11,6 +11,7 @@ logger = logging.getLogger(__name__)
 class MainWindow(QMainWindow):
     context = Signal(QWidget)
     builder = Signal(list)
+    liveness = Signal(object)
 
     def __init__(self):
         super().__init__()
@@ -25,6 +26,8 @@ class MainWindow(QMainWindow):
         from client.network.websocket import Client
         client = Client()
         client.bind(self)
+        # 连接状态在连接线程中变化, 通过信号转发到界面线程
+        client.listeners.append(self.liveness.emit)
 
         secrets = Secrets()
         secrets.load()
@@ -1,2 +1,3 @@
 from .common import handle_exception
 from .port import serial_ports
+from .backoff import Backoff
@@ -0,0 +1,19 @@
+import random
+
+
+class Backoff:
+    def __init__(self, initial: float = 1.0, maximum: float = 300.0, factor: float = 2.0, jitter: float = 0.5):
+        self.initial: float = initial
+        self.maximum: float = maximum
+        self.factor: float = factor
+        self.jitter: float = jitter
+        self.attempts: int = 0
+
+    def next(self) -> float:
+        delay = min(self.maximum, self.initial * self.factor ** self.attempts)
+        self.attempts += 1
+        # 在 [delay * (1 - jitter), delay] 范围内随机, 避免多个设备同时重试
+        return delay - random.uniform(0, delay * self.jitter)
+
+    def reset(self):
+        self.attempts = 0
@@ -0,0 +1,36 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip('pymodbus')
+pytest.importorskip('PySide6')
+
+from client.network.breaker import BreakerState
+from client.network.bus import Bus
+
+
+class HangingClient:
+    connected = False
+
+    async def connect(self):
+        await asyncio.sleep(60)
+
+
+def test_cancelled_half_open_connect_reopens_breaker(monkeypatch):
+    async def probe(self) -> bool:
+        return True
+
+    monkeypatch.setattr(Bus, 'probe', probe)
+
+    async def run():
+        bus = Bus('/dev/null', HangingClient())
+        bus.breaker.failure()
+        assert bus.breaker.state == BreakerState.OPEN
+        bus.breaker.retry_at = 0.0
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(bus.connect(), 0.05)
+        assert bus.breaker.state == BreakerState.OPEN
+        bus.breaker.retry_at = 0.0
+        assert bus.breaker.allow()
+
+    asyncio.run(run())
@@ -0,0 +1,68 @@
+import zlib
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('jsonobject')
+pytest.importorskip('websockets')
+pytest.importorskip('PySide6')
+
+from client.abstract import serialize as module
+from client.abstract.serialize import Codec, codecs, identify, negotiate, serializable
+from client.abstract.packet import OutgoingPacket
+from client.network.serializable import SensorReport
+from client.network.serializable.packet import Report, ReportBatch
+
+
+def batch() -> ReportBatch:
+    # 按发件箱恢复的方式构造, 不分配新的序号
+    reports = []
+    for index in range(3):
+        report = SensorReport('n', f's{index}', 'T', {'a': float(index)}, datetime(2026, 1, 1))
+        reports.append(Report({'index': index, 'report': report.to_json()}))
+    return ReportBatch('n', reports)
+
+
+def test_negotiate_falls_back_to_json():
+    assert negotiate(None) is codecs['json']
+    assert negotiate('') is codecs['json']
+    assert negotiate('cbor') is codecs['json']
+    assert negotiate(' JSON ') is codecs['json']
+    # JSON 总是可用, 且排在所有可选编码之后
+    assert list(codecs)[-1] == 'json'
+
+
+def test_negotiate_picks_msgpack_when_installed():
+    pytest.importorskip('msgpack')
+    codec = negotiate('MsgPack')
+    assert codec.name == 'msgpack' and codec.binary
+
+
+@pytest.mark.parametrize('name', list(codecs))
+def test_codec_round_trip(name):
+    codec: Codec = codecs[name]
+    packet = batch()
+    payload = codec.encode(packet)
+    assert isinstance(payload, bytes if codec.binary else str)
+    decoded = codec.decode(payload)
+    assert isinstance(decoded, ReportBatch)
+    assert decoded.to_json() == packet.to_json()
+
+
+def test_identifiers_are_crc32_of_names():
+    name = 'cn.edu.bistu.smartpond.packet.PacketInReport'
+    assert identify(name) == zlib.crc32(name.encode('utf-8'))
+    for identifier, name in module.identifiers.items():
+        assert identify(name) == identifier
+        assert name in module.registered
+
+
+def test_colliding_identifier_is_rejected(monkeypatch):
+    monkeypatch.setitem(module.identifiers, identify('example.Colliding'), 'example.Existing')
+
+    class Colliding(OutgoingPacket):
+        __serial_name__ = 'example.Colliding'
+
+    with pytest.raises(ValueError):
+        serializable(Colliding)
+    assert 'example.Colliding' not in module.registered
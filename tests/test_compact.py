@@ -0,0 +1,64 @@
+import calendar
+import time
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('jsonobject')
+pytest.importorskip('websockets')
+pytest.importorskip('PySide6')
+
+from client.network.compact import Handles
+from client.network.serializable import Sensor, SensorField, SensorReport, SensorStructure
+from client.network.serializable.packet import CompactReports, Report, ReportBatch
+
+moment = datetime(2026, 1, 1, 8, 30, 15, 250000)
+
+
+def handles() -> Handles:
+    structure = SensorStructure(type='T', fields={x: SensorField(key=x) for x in ('a', 'b', 'c')})
+    sensors = [Sensor(id='s0', type='T'), Sensor(id='s1', type='T'), Sensor(id='s2', type='unknown')]
+    return Handles(sensors, {'T': structure})
+
+
+def report(sensor: str, fields: dict, index: int = 7) -> Report:
+    # 按发件箱恢复的方式构造, 不分配新的序号
+    return Report({'index': index, 'report': SensorReport('n', sensor, 'T', fields, moment).to_json()})
+
+
+def test_row_orders_values_by_slot():
+    table = handles()
+    # 没有结构的传感器不分配句柄
+    assert table.sensors == ['s0', 's1']
+    epoch = calendar.timegm(moment.timetuple()) * 1000 + 250
+    assert table.row(report('s1', {'c': 3.0, 'a': 1.0})) == [7, 1, epoch, 0b101, 1.0, 3.0]
+    assert table.row(report('s2', {'a': 1.0})) is None
+    assert table.row(report('s0', {'z': 1.0})) is None
+    merged = report('s0', {'a': 1.0})
+    merged.merged = [6]
+    assert table.row(merged) is None
+
+
+@pytest.mark.parametrize('zone', ['UTC', 'Asia/Shanghai', 'America/New_York'])
+def test_row_timestamp_ignores_local_zone(monkeypatch, zone):
+    if not hasattr(time, 'tzset'):
+        pytest.skip('无法切换时区')
+    monkeypatch.setenv('TZ', zone)
+    time.tzset()
+    try:
+        row = handles().row(report('s0', {'a': 1.0}))
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+    # 与 JSON 格式相同, 时间戳按 UTC 解释
+    assert row[2] == calendar.timegm(moment.timetuple()) * 1000 + 250
+
+
+def test_compact_falls_back_when_any_report_cannot_be_encoded():
+    table = handles()
+    batch = ReportBatch('n', [report('s0', {'a': 1.0}, 1), report('s1', {'b': 2.0}, 2)])
+    packet = table.compact(batch)
+    assert isinstance(packet, CompactReports)
+    assert packet.nodeId == 'n'
+    assert [x[:2] for x in packet.rows] == [[1, 0], [2, 1]]
+    assert table.compact(ReportBatch('n', [report('s0', {'a': 1.0}), report('s2', {'a': 1.0})])) is None
@@ -0,0 +1,50 @@
+import math
+import random
+
+import numpy
+import pytest
+
+from client.network.gorilla import Chunk, decode
+
+
+def encode(timestamps, values) -> Chunk:
+    chunk = Chunk()
+    for timestamp, value in zip(timestamps, values):
+        chunk.append(timestamp, value)
+    return chunk
+
+
+def test_round_trip_is_lossless():
+    generator = random.Random(15)
+    timestamps, values = [], []
+    timestamp = 1_700_000_000_000
+    for index in range(2000):
+        # 覆盖二阶差分为 0, 各个编码区间以及 64 位原值的情况
+        timestamp += generator.choice([1000, 1000, 1000, 999, 1003, 1200, 5000, 3_600_000, 2 ** 40])
+        timestamps.append(timestamp)
+        values.append(generator.choice([20.5, 20.5, generator.uniform(-1e6, 1e6), 0.0, -0.0, 1e-300, math.inf]))
+    chunk = encode(timestamps, values)
+    decoded_timestamps, decoded_values = decode(chunk.to_bytes(), chunk.count)
+    assert decoded_timestamps.tolist() == timestamps
+    # 按位比较, 保留 -0.0 等特殊值
+    assert decoded_values.view(numpy.uint64).tolist() == numpy.array(values).view(numpy.uint64).tolist()
+
+
+def test_summary_and_nan():
+    chunk = encode([10, 20, 30], [1.0, float('nan'), 3.0])
+    timestamps, values = decode(chunk.to_bytes(), chunk.count)
+    assert timestamps.tolist() == [10, 20, 30]
+    assert math.isnan(values[1]) and values[0] == 1.0 and values[2] == 3.0
+    assert (chunk.start, chunk.end, chunk.count) == (10, 30, 3)
+
+
+def test_out_of_order_timestamps_are_rejected():
+    chunk = encode([10], [1.0])
+    with pytest.raises(ValueError):
+        chunk.append(10, 2.0)
+
+
+def test_truncated_chunk_is_detected():
+    chunk = encode(range(0, 1000, 10), [float(x) * 1.1 for x in range(100)])
+    with pytest.raises(ValueError):
+        decode(chunk.to_bytes()[:-20], chunk.count)
@@ -0,0 +1,35 @@
+import struct
+
+import pytest
+
+pytest.importorskip('pymodbus')
+pytest.importorskip('PySide6')
+
+from pymodbus.factory import ClientDecoder
+from pymodbus.utilities import computeCRC
+
+from client.network.bus import CheckedRtuFramer
+from client.network.metrics import DeviceMetrics
+
+
+def frame(corrupt: bool = False) -> bytes:
+    payload = bytes([1, 3, 2, 0, 10])
+    crc = computeCRC(payload) ^ (0xFFFF if corrupt else 0)
+    return payload + struct.pack('>H', crc)
+
+
+def test_framer_counts_crc_failures():
+    framer = CheckedRtuFramer(ClientDecoder())
+    responses = []
+    framer.processIncomingPacket(frame(), responses.append, slave=1)
+    assert len(responses) == 1 and framer.crc_errors == 0
+    framer.processIncomingPacket(frame(corrupt=True), responses.append, slave=1)
+    assert len(responses) == 1 and framer.crc_errors == 1
+
+
+def test_failure_classification():
+    metrics = DeviceMetrics('test')
+    metrics.failure(RuntimeError('health check failed'))
+    metrics.failure(TimeoutError())
+    metrics.failure(TimeoutError(), crc=True)
+    assert (metrics.errors, metrics.timeouts, metrics.crc_errors, metrics.requests) == (1, 1, 1, 3)
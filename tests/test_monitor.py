@@ -0,0 +1,99 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('pymodbus')
+pytest.importorskip('PySide6')
+
+from client.network.breaker import Breaker, BreakerState
+from client.network.bus import Bus
+from client.network.metrics import DeviceMetrics
+from client.network.monitor import Monitor
+
+
+class Client:
+    connected = False
+    framer = None
+
+    async def connect(self):
+        self.connected = True
+
+
+class Decoder:
+    def __init__(self, reads: list, error: Exception | None = None):
+        self.reads: list = reads
+        self.error: Exception | None = error
+
+    def decode(self, payloads: list) -> list:
+        raise self.error
+
+
+def monitor(bus, decoder) -> Monitor:
+    # 只构造 pull 用到的部分, 不加载配置与存储
+    instance = Monitor.__new__(Monitor)
+    instance.sensor = SimpleNamespace(name='T', fields={})
+    instance.structure = SimpleNamespace(fields={})
+    instance.profile = SimpleNamespace(decoder=decoder if callable(decoder) else lambda *_: decoder)
+    instance.bus = bus
+    instance.slave = 1
+    instance.breaker = Breaker('设备 T', threshold=1)
+    instance.metrics = DeviceMetrics('T')
+    return instance
+
+
+def probing(target: Monitor):
+    target.breaker.failure()
+    target.breaker.retry_at = 0.0
+
+
+def test_refused_bus_connect_is_not_a_reconnect():
+    bus = Bus('/dev/null', Client())
+    bus.breaker.failure()
+    assert bus.breaker.state == BreakerState.OPEN
+    target = monitor(bus, Decoder([]))
+    assert asyncio.run(target.pull()) is None
+    assert target.metrics.reconnects == 0 and bus.attempts == 0
+    # 断路器放行后才算一次重连
+    bus.breaker.retry_at = 0.0
+    bus.breaker.state = BreakerState.CLOSED
+    asyncio.run(target.connect())
+    assert bus.attempts == 1
+
+
+def test_half_open_probe_resolves_when_decoding_fails():
+    bus = SimpleNamespace(connected=True, attempts=0, merge_gap=0, crc_errors=0)
+    target = monitor(bus, Decoder([], ValueError('bad payload')))
+    probing(target)
+    with pytest.raises(ValueError):
+        asyncio.run(target.pull())
+    # 探测失败后重新断开, 而不是停留在试探状态
+    assert target.breaker.state == BreakerState.OPEN
+
+    def broken(*_):
+        raise KeyError('profile')
+
+    target = monitor(bus, broken)
+    probing(target)
+    with pytest.raises(KeyError):
+        asyncio.run(target.pull())
+    assert target.breaker.state == BreakerState.OPEN
+
+
+def test_half_open_probe_resolves_when_cancelled():
+    async def read(*_):
+        await asyncio.sleep(60)
+
+    bus = SimpleNamespace(connected=True, attempts=0, merge_gap=0, crc_errors=0, read=read)
+    target = monitor(bus, Decoder([SimpleNamespace(address=0, count=1, function=3)]))
+    probing(target)
+
+    async def run():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(target.pull(), 0.05)
+
+    asyncio.run(run())
+    assert target.breaker.state == BreakerState.OPEN
+    target.breaker.retry_at = 0.0
+    assert target.breaker.allow()
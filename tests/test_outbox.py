@@ -0,0 +1,144 @@
+import sqlite3
+import time
+from concurrent.futures import Future
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('jsonobject')
+pytest.importorskip('websockets')
+pytest.importorskip('PySide6')
+
+from client.abstract.meta import Singleton
+from client.abstract.serialize import deserialize, serialize
+from client.network import outbox as module
+from client.network.outbox import Outbox
+from client.network.serializable import SensorReport
+from client.network.serializable.packet import Report, ReportBatch
+from client.network.websocket import Client
+
+
+class FakeConnection:
+    def __init__(self):
+        self.sent: list = []
+        # 依次作为各次发送的结果, 用完后总是成功
+        self.results: list = []
+
+    def send(self, packet) -> Future[bool]:
+        self.sent.append(packet)
+        result = self.results.pop(0) if len(self.results) > 0 else True
+        if isinstance(result, Future):
+            return result
+        future = Future()
+        future.set_result(result)
+        return future
+
+
+def report(node: str, sensor: str, second: int) -> Report:
+    return Report(SensorReport(node, sensor, 'T', {'a': float(second)}, datetime(2026, 1, 1, 0, 0, second)))
+
+
+def count(path: str) -> int:
+    with sqlite3.connect(path) as database:
+        return database.execute('SELECT COUNT(*) FROM reports').fetchone()[0]
+
+
+def wait(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, '等待超时'
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def outbox(tmp_path, monkeypatch):
+    Singleton._instances.pop(Outbox, None)
+    instance = Outbox(path=str(tmp_path / 'outbox.db'), rate=1e6)
+    online = [False]
+    monkeypatch.setattr(module, 'online', lambda: online[0])
+    connection = FakeConnection()
+    monkeypatch.setattr(Client(), '_Client__connection', connection)
+    yield instance, online, connection
+    instance.stop(1)
+    Singleton._instances.pop(Outbox, None)
+
+
+def test_packets_survive_serialization(outbox):
+    original = report('node', 's1', 1)
+    restored = deserialize(serialize(original))
+    assert isinstance(restored, Report)
+    assert restored.index == original.index
+    assert restored.report.nodeId == 'node'
+    assert restored.report.fields == {'a': 1.0}
+    batch = deserialize(serialize(ReportBatch('node', [report('node', 's1', 2), report('node', 's2', 3)])))
+    assert isinstance(batch, ReportBatch)
+    assert batch.nodeId == 'node'
+    assert [x.index for x in batch.reports] == [original.index + 1, original.index + 2]
+
+
+def test_stored_reports_are_replayed_in_order(outbox):
+    instance, online, connection = outbox
+    instance.launch()
+    reports = [report('node', f's{x}', x) for x in (1, 2, 3)]
+    instance.send(reports[0])
+    instance.send(ReportBatch('node', reports[1:]))
+    wait(lambda: count(instance.path) == 2)
+    # 无法解析的数据被丢弃, 不影响其余数据的补发
+    with sqlite3.connect(instance.path) as database:
+        database.execute("INSERT INTO reports VALUES (?, 'not a packet')", (reports[-1].index + 1,))
+    instance.restore(1)
+
+    online[0] = True
+    wait(lambda: instance.pending == 0)
+    assert all(isinstance(x, ReportBatch) and x.nodeId == 'node' for x in connection.sent)
+    replayed = [x for frame in connection.sent for x in frame.reports]
+    assert [x.index for x in replayed] == [x.index for x in reports]
+    assert [x.report.fields['a'] for x in replayed] == [1.0, 2.0, 3.0]
+    assert count(instance.path) == 0
+    assert instance.acknowledged == reports[-1].index
+    assert instance.thread.is_alive()
+
+
+def test_replay_stops_at_first_failed_frame(outbox):
+    instance, online, connection = outbox
+    instance.frame_size = 1
+    instance.launch()
+    reports = [report('node', f's{x}', x) for x in (1, 2, 3)]
+    for item in reports:
+        instance.send(item)
+    wait(lambda: count(instance.path) == 3)
+
+    connection.results = [True, False]
+    online[0] = True
+    wait(lambda: len(connection.sent) >= 2)
+    time.sleep(0.2)
+    # 第二帧失败后不再发送第三帧, 确认的序号停在第一帧
+    assert len(connection.sent) == 2
+    assert count(instance.path) == 2
+    assert instance.acknowledged == reports[0].index
+
+    wait(lambda: instance.pending == 0)
+    replayed = [x.reports[0].index for x in connection.sent]
+    assert replayed == [reports[0].index, reports[1].index, reports[1].index, reports[2].index]
+    assert instance.acknowledged == reports[-1].index
+
+
+def test_live_send_waits_for_earlier_result(outbox):
+    instance, online, connection = outbox
+    instance.launch()
+    online[0] = True
+    first, second = report('node', 's1', 1), report('node', 's2', 2)
+    pending = Future()
+    connection.results = [pending]
+    instance.send(first)
+    # 第一条仍未得到结果, 第二条进入发件箱而不是直接发送
+    instance.send(second)
+    assert connection.sent == [first]
+    assert instance.pending == 1
+
+    pending.set_result(False)
+    wait(lambda: instance.pending == 0)
+    assert connection.sent[0] is first
+    replayed = [x.index for frame in connection.sent[1:] for x in frame.reports]
+    assert replayed == [first.index, second.index]
+    assert instance.acknowledged == second.index
@@ -0,0 +1,121 @@
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip('PySide6')
+
+from client.network.metrics import OutboundMetrics
+from client.network.outgoing import Backpressure, Priority, SendQueue, coalesce
+
+
+class Packet:
+    def __init__(self, name: str, priority: Priority):
+        self.name: str = name
+        self.priority: Priority = priority
+
+
+def names(queue: SendQueue) -> list:
+    return [x.packet.name for x in queue.take(len(queue))]
+
+
+def report(node: str, sensor: str, fields: dict, index: int = 0):
+    from client.network.serializable import SensorReport
+    from client.network.serializable.packet import Report
+    # 按发件箱恢复的方式构造, 不分配新的序号
+    return Report({'index': index, 'report': SensorReport(node, sensor, 'T', fields, datetime(2026, 1, 1)).to_json()})
+
+
+def test_telemetry_keeps_its_share_behind_control():
+    queue = SendQueue(share=0.25, metrics=OutboundMetrics())
+    for index in range(3):
+        queue.put(Packet(f't{index}', Priority.TELEMETRY))
+    for index in range(6):
+        queue.put(Packet(f'c{index}', Priority.CONTROL))
+    queue.put(Packet('i0', Priority.INTERACTIVE))
+    # 每发送三个高优先级数据包插入一个传感器数据包
+    assert names(queue) == ['c0', 'c1', 'c2', 't0', 'c3', 'c4', 'c5', 't1', 'i0', 't2']
+
+
+def test_drop_oldest_discards_telemetry_first():
+    metrics = OutboundMetrics()
+    queue = SendQueue(capacity=2, policy=Backpressure.DROP_OLDEST, metrics=metrics)
+    telemetry = queue.put(Packet('t0', Priority.TELEMETRY))
+    queue.put(Packet('c0', Priority.CONTROL))
+    queue.put(Packet('c1', Priority.CONTROL))
+    assert telemetry.result(0) is False
+    assert metrics.dropped == 1
+    assert names(queue) == ['c0', 'c1']
+
+
+def test_block_gives_up_after_timeout():
+    metrics = OutboundMetrics()
+    queue = SendQueue(capacity=1, policy=Backpressure.BLOCK, timeout=0.05, metrics=metrics)
+    first = queue.put(Packet('t0', Priority.TELEMETRY))
+    second = queue.put(Packet('t1', Priority.TELEMETRY))
+    assert second.result(0) is False
+    assert not first.done()
+    assert metrics.blocked == 1 and metrics.dropped == 1
+    # 写入线程不等待空位, 改为丢弃最早的数据
+    queue.put(Packet('t2', Priority.TELEMETRY), block=False)
+    assert first.result(0) is False
+    assert names(queue) == ['t2']
+
+
+def test_block_resumes_when_space_frees():
+    queue = SendQueue(capacity=1, policy=Backpressure.BLOCK, timeout=5.0, metrics=OutboundMetrics())
+    queue.put(Packet('t0', Priority.TELEMETRY))
+    taken = []
+    timer = threading.Timer(0.05, lambda: taken.extend(queue.take(1)))
+    timer.start()
+    started = time.monotonic()
+    future = queue.put(Packet('t1', Priority.TELEMETRY))
+    timer.join()
+    assert time.monotonic() - started < 5.0
+    assert not future.done()
+    assert [x.packet.name for x in taken] == ['t0']
+    assert names(queue) == ['t1']
+
+
+def test_close_fails_pending_and_later_packets():
+    queue = SendQueue(metrics=OutboundMetrics())
+    pending = queue.put(Packet('c0', Priority.CONTROL))
+    queue.close()
+    assert pending.result(0) is False
+    assert queue.put(Packet('c1', Priority.CONTROL)).result(0) is False
+    assert len(queue) == 0
+
+
+def test_merge_keeps_latest_fields_per_sensor():
+    pytest.importorskip('jsonobject')
+    metrics = OutboundMetrics()
+    queue = SendQueue(capacity=2, policy=Backpressure.MERGE, metrics=metrics)
+    first = queue.put(report('n', 's0', {'a': 1.0, 'b': 2.0}, 1))
+    other = queue.put(report('n', 's1', {'a': 5.0}, 2))
+    second = queue.put(report('n', 's0', {'a': 3.0}, 3))
+    assert metrics.merged == 1 and metrics.dropped == 0
+    envelopes = queue.take(len(queue))
+    assert [x.packet.report.sensorId for x in envelopes] == ['s1', 's0']
+    assert envelopes[1].packet.report.fields == {'a': 3.0, 'b': 2.0}
+    # 被取代的序号随新报告一起发送
+    assert envelopes[1].packet.index == 3 and envelopes[1].packet.merged == [1]
+    assert 'merged' not in envelopes[0].packet.to_json()
+    envelopes[1].resolve(True)
+    assert first.result(0) is True and second.result(0) is True
+    assert not other.done()
+
+
+def test_coalesce_batches_consecutive_reports_per_node():
+    pytest.importorskip('jsonobject')
+    from client.network.serializable.packet import Report, ReportBatch
+    queue = SendQueue(metrics=OutboundMetrics())
+    for index in range(3):
+        queue.put(report('n0', f's{index}', {'a': float(index)}))
+    queue.put(report('n1', 's0', {'a': 0.0}))
+    groups = coalesce(queue.take(len(queue)), frame_size=2)
+    packets = [x[0] for x in groups]
+    assert [type(x) for x in packets] == [ReportBatch, Report, Report]
+    assert [x.report.sensorId for x in packets[0].reports] == ['s0', 's1']
+    assert packets[1].report.sensorId == 's2' and packets[2].report.nodeId == 'n1'
+    assert [len(x[1]) for x in groups] == [2, 1, 1]
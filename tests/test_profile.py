@@ -0,0 +1,42 @@
+import pytest
+
+pytest.importorskip('PySide6')
+pytest.importorskip('yaml')
+
+from client.network.profile import DeviceProfile
+
+
+def profile(fields: dict) -> DeviceProfile:
+    return DeviceProfile.load('T', {'type': 'int16', 'blocks': [{'address': 0, 'count': 8}], 'fields': fields})
+
+
+def test_disabled_field_with_offset_is_not_reported():
+    device = profile({'temp': {'register': 0, 'scale': 0.1, 'offset': -40}, 'ph': {'register': 3}})
+    decoder = device.decoder(['temp', 'ph'], ['ph'])
+    # 只读取启用字段所在的寄存器
+    assert [(x.address, x.count) for x in decoder.reads] == [(3, 1)]
+    assert decoder.decode([[7]]) == [None, 7]
+
+
+def test_enabled_fields_are_scaled():
+    device = profile({'temp': {'register': 0, 'scale': 0.1, 'offset': -40}, 'ph': {'register': 3}})
+    decoder = device.decoder(['temp', 'ph'], gap=2)
+    assert [(x.address, x.count) for x in decoder.reads] == [(0, 4)]
+    assert decoder.decode([[500, 0, 0, 7]]) == [pytest.approx(10.0), 7]
+
+
+def test_disabled_field_sharing_a_register_stays_empty():
+    device = profile({'a': {'register': 2}, 'b': {'register': 2, 'offset': 1}, 'c': {'register': 6}})
+    decoder = device.decoder(['a', 'b', 'c'], ['a'])
+    assert decoder.decode([[5]]) == [5, None, None]
+    # 未映射的字段同样为空
+    assert device.decoder(['a', 'missing']).decode([[5]]) == [5, None]
+
+
+def test_plan_merges_reads_within_gap():
+    device = profile({'a': {'register': 0}, 'b': {'register': 3}, 'c': {'register': 7}})
+    assert [(x.address, x.count) for x in device.decoder(['a', 'b', 'c'], gap=0).reads] == [(0, 1), (3, 1), (7, 1)]
+    assert [(x.address, x.count) for x in device.decoder(['a', 'b', 'c'], gap=4).reads] == [(0, 8)]
+    decoder = device.decoder(['a', 'b', 'c'], gap=2)
+    assert [(x.address, x.count) for x in decoder.reads] == [(0, 4), (7, 1)]
+    assert decoder.decode([[1, 9, 9, 2], [3]]) == [1, 2, 3]
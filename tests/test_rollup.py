@@ -0,0 +1,58 @@
+import numpy
+import pytest
+
+from client.network.rollup import Rollup, Tier
+
+
+def tier(capacity: int = 4) -> Tier:
+    instance = Tier(60, capacity)
+    # 按 UTC 对齐, 不受运行环境的时区影响
+    instance.offset = 0
+    return instance
+
+
+def test_window_stays_contiguous_after_wrapping():
+    target = tier()
+    for minute in range(7):
+        target.add(minute * 60 + 5, float(minute))
+    assert len(target) == 4
+    starts, minimum, maximum, total, count = target.window()
+    assert starts.tolist() == [180, 240, 300, 360]
+    assert total.tolist() == [3.0, 4.0, 5.0, 6.0]
+    assert count.tolist() == [1, 1, 1, 1]
+    # 窗口是环形缓冲区上的只读视图, 不复制数据
+    assert all(x.base is not None for x in (starts, minimum, maximum, total, count))
+    with pytest.raises(ValueError):
+        total[0] = 0.0
+
+
+def test_samples_merge_into_their_bucket():
+    target = tier()
+    for timestamp, value in ((60, 2.0), (90, -1.0), (119, 5.0), (120, 1.0)):
+        target.add(timestamp, value)
+    starts, minimum, maximum, total, count = target.window()
+    assert starts.tolist() == [60, 120]
+    assert minimum.tolist() == [-1.0, 1.0] and maximum.tolist() == [5.0, 1.0]
+    assert total.tolist() == [6.0, 1.0] and count.tolist() == [3, 1]
+    # 时钟回拨后早于最新桶且没有对应桶的样本被丢弃
+    target.add(0, 9.0)
+    assert target.window()[0].tolist() == [60, 120]
+
+
+def test_window_range_selects_buckets():
+    target = tier(8)
+    for minute in range(6):
+        target.add(minute * 60, float(minute))
+    starts, _, _, total, _ = target.window(130, 300)
+    # 起点所在的桶包含在内, 终点不包含
+    assert starts.tolist() == [120, 180, 240]
+    assert numpy.array_equal(total, [2.0, 3.0, 4.0])
+
+
+def test_rollup_picks_coarsest_dividing_tier():
+    rollup = Rollup()
+    assert rollup.tier(30) is None
+    assert rollup.tier(120).width == 60
+    assert rollup.tier(1200).width == 600
+    assert rollup.tier(7200).width == 3600
+    assert rollup.tier(86400).width == 86400
@@ -0,0 +1,50 @@
+from client.network import scheduler
+from client.network.scheduler import Scheduler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_deadlines_do_not_drift(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(scheduler.time, 'monotonic', clock)
+    schedules = Scheduler()
+    schedules.add('a', 10.0)
+    for cycle in range(100):
+        assert schedules.due() == ['a']
+        # 每次轮询都有耗时, 下次截止时间仍然对齐到 anchor + n * interval
+        clock.now += 0.7
+        schedules.done('a')
+        assert schedules.get('a').deadline == 1000.0 + (cycle + 1) * 10.0
+        clock.now = schedules.get('a').deadline
+
+
+def test_overrun_skips_missed_cycles(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(scheduler.time, 'monotonic', clock)
+    schedules = Scheduler()
+    schedules.add('a', 10.0)
+    assert schedules.due() == ['a']
+    clock.now += 25.0
+    schedules.done('a')
+    assert schedules.get('a').skipped == 2
+    assert schedules.get('a').deadline == 1030.0
+
+
+def test_running_schedule_is_not_due_twice(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(scheduler.time, 'monotonic', clock)
+    schedules = Scheduler()
+    schedules.add('a', 1.0)
+    schedules.add('b', 1.0, delay=5.0)
+    assert schedules.due() == ['a']
+    clock.now += 2.0
+    assert schedules.due() == []
+    assert schedules.delay() == 3.0
+    schedules.remove('b')
+    assert schedules.delay() is None
@@ -0,0 +1,76 @@
+import threading
+
+import numpy
+
+from client.network.segment import Segment
+
+
+def fill(segment: Segment, start: int, end: int):
+    timestamps = numpy.arange(start, end, dtype=numpy.int64)
+    segment.append(timestamps, timestamps.astype(numpy.float64))
+
+
+def test_trim_keeps_newer_samples(tmp_path):
+    segment = Segment(str(tmp_path), 'sensor', 'field')
+    fill(segment, 0, 100)
+    segment.trim(40)
+    timestamps, values = segment.view()
+    assert timestamps.tolist() == list(range(40, 100))
+    assert values.tolist() == [float(x) for x in range(40, 100)]
+    # 裁剪后继续追加仍保持两列对齐
+    fill(segment, 100, 110)
+    timestamps, values = segment.view()
+    assert len(timestamps) == len(values) == 70
+    assert (timestamps.astype(numpy.float64) == values).all()
+
+
+def test_view_never_mixes_generations(tmp_path):
+    segment = Segment(str(tmp_path), 'sensor', 'field')
+    fill(segment, 0, 20000)
+    stop = threading.Event()
+    mismatched = []
+
+    def read():
+        while not stop.is_set():
+            try:
+                timestamps, values = segment.view()
+            except ValueError as ex:
+                # 映射长度超过文件实际长度
+                mismatched.append(ex)
+                continue
+            if len(timestamps) != len(values) or not (timestamps.astype(numpy.float64) == values).all():
+                mismatched.append(len(timestamps))
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    try:
+        for before in range(100, 20000, 100):
+            segment.trim(before)
+    finally:
+        stop.set()
+        reader.join()
+    assert mismatched == []
+    assert segment.view()[0].tolist() == list(range(19900, 20000))
+
+
+def test_view_during_appends_sees_whole_rows(tmp_path):
+    segment = Segment(str(tmp_path), 'sensor', 'field')
+    stop = threading.Event()
+    mismatched = []
+
+    def read():
+        while not stop.is_set():
+            timestamps, values = segment.view()
+            if len(timestamps) != len(values) or not (timestamps.astype(numpy.float64) == values).all():
+                mismatched.append(len(timestamps))
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    try:
+        for start in range(0, 20000, 100):
+            fill(segment, start, start + 100)
+    finally:
+        stop.set()
+        reader.join()
+    assert mismatched == []
+    assert len(segment) == 20000
@@ -0,0 +1,36 @@
+import asyncio
+import struct
+
+import pytest
+
+pytest.importorskip('PySide6')
+
+from client.network.simulator import Faults, Farm, VirtualDevice
+
+
+def test_gateway_answers_pipelined_requests():
+    devices = [VirtualDevice(x, {0: x * 10, 1: x * 10 + 1}, Faults(latency=0.0)) for x in (1, 2)]
+    loop = asyncio.new_event_loop()
+    farm = Farm()
+    path = farm.add(devices, gateway=True)
+    assert path.startswith('tcp://127.0.0.1:')
+    farm.start(loop)
+
+    async def request():
+        reader, writer = await asyncio.open_connection('127.0.0.1', farm.gateways[0].port)
+        for tid, slave in enumerate((1, 2), start=1):
+            writer.write(struct.pack('>HHHBBHH', tid, 0, 6, slave, 3, 0, 2))
+        await writer.drain()
+        responses = {}
+        for _ in range(2):
+            tid, _, length, slave = struct.unpack('>HHHB', await reader.readexactly(7))
+            function, size, *registers = struct.unpack('>BB2H', await reader.readexactly(length - 1))
+            responses[tid] = (slave, registers)
+        writer.close()
+        return responses
+
+    try:
+        assert loop.run_until_complete(request()) == {1: (1, [10, 11]), 2: (2, [20, 21])}
+    finally:
+        farm.close(loop)
+        loop.close()
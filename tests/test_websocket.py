@@ -0,0 +1,87 @@
+import asyncio
+import time
+from concurrent.futures import Future
+
+import pytest
+
+pytest.importorskip('jsonobject')
+pytest.importorskip('websockets')
+pytest.importorskip('PySide6')
+
+from client.abstract.meta import Singleton
+from client.network import websocket as module
+from client.network.outbox import Outbox
+from client.network.websocket import Client, Connection, Liveness
+from client.util.backoff import Backoff
+
+
+class FakeSocket:
+    def __init__(self, frames: list, error: Exception | None = None):
+        self.frames: list = frames
+        self.error: Exception | None = error
+        self.response_headers: dict = {}
+        self.open: bool = True
+        self.closed: bool = False
+        self.codes: list = []
+
+    def __aiter__(self):
+        return self.__iterate()
+
+    async def __iterate(self):
+        for frame in self.frames:
+            yield frame
+        if self.error is not None:
+            raise self.error
+        while not self.closed:
+            await asyncio.sleep(0.01)
+
+    async def close(self, code: int = 1000, reason: str = ''):
+        self.codes.append(code)
+        self.open = False
+        self.closed = True
+
+
+def wait(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, '等待超时'
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    Singleton._instances.pop(Outbox, None)
+    instance = Outbox(path=str(tmp_path / 'outbox.db'))
+    yield instance
+    Singleton._instances.pop(Outbox, None)
+
+
+def test_reconnects_after_bad_frames_and_listener_errors(monkeypatch, outbox):
+    sockets = [
+        # 无法解析的数据包被跳过, 之后的意外错误只结束本次连接
+        FakeSocket(['{not json', b'\x00\x01'], RuntimeError('boom')),
+        FakeSocket(['still not json']),
+    ]
+    opened = []
+
+    async def connect(url, extra_headers=None):
+        socket = sockets[len(opened)]
+        opened.append(socket)
+        return socket
+
+    monkeypatch.setattr(module, 'connect', connect)
+    states = []
+    Client().listeners.append(states.append)
+    connection = Connection(None, 'token', Future(), backoff=Backoff(initial=0.01, maximum=0.01))
+    try:
+        connection.start()
+        wait(lambda: len(opened) == 2 and connection.state == Liveness.ONLINE)
+        time.sleep(0.05)
+        assert connection.is_alive()
+        assert connection.state == Liveness.ONLINE
+        assert sockets[0].codes == [1011]
+        connection.stop().result(5)
+        connection.join(5)
+    finally:
+        Client().listeners.remove(states.append)
+    assert states == [Liveness.ONLINE, Liveness.RECONNECTING, Liveness.ONLINE, Liveness.OFFLINE]